@@ -27,7 +27,13 @@ prescribed correctly.
 
 from perconet.periodicnetwork import PeriodicNetwork
 from perconet.loopfinder import LoopFinder
+from perconet.percolationtracker import PercolationTracker, bond_percolation_sweep
+from perconet.batch import analyze_snapshot, analyze_many
+from perconet.trajectory import TrajectoryAnalyzer, analyze_trajectory
+from perconet.resultcache import ResultCache
 
-__all__ = ["PeriodicNetwork", "LoopFinder"]
+__all__ = ["PeriodicNetwork", "LoopFinder", "PercolationTracker", "bond_percolation_sweep",
+           "analyze_snapshot", "analyze_many", "TrajectoryAnalyzer", "analyze_trajectory",
+           "ResultCache"]
 
 __version__ = "0.3.1"
@@ -0,0 +1,102 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import os
+import collections
+import concurrent.futures
+import itertools
+import numpy as np
+from perconet.periodicnetwork import PeriodicNetwork
+from perconet.loopfinder import LoopFinder
+
+
+def analyze_snapshot(snapshot, n=None, engine="tree", cache=None):
+    """
+    Find the independent loops of a single snapshot.
+
+    Args:
+        snapshot (str or :obj:`numpy.ndarray`): The path of a bond file, which is read with
+            :obj:`numpy.loadtxt`, or an integer array with shape (E, 2 + dim) with one
+            bond per row as in :obj:`PeriodicNetwork.from_edge_array`.
+        n (int, optional): The number of nodes. Defaults to the largest node index
+            in the snapshot plus 1.
+        engine (str, optional): The search engine of the :obj:`LoopFinder`.
+        cache (:obj:`perconet.ResultCache`, optional): If given, the loops are taken from
+            this cache if the same network was analyzed before, and stored in it otherwise.
+
+    Returns:
+        Tuple[:obj:`numpy.ndarray`, int]: The independent loops and their number,
+        as returned by :obj:`LoopFinder.get_independent_loops`.
+    """
+    if isinstance(snapshot, (str, os.PathLike)):
+        snapshot = np.loadtxt(snapshot, dtype=int, ndmin=2)
+    network = PeriodicNetwork.from_edge_array(snapshot, n=n, storage="csr")
+    if cache is not None:
+        return cache.get_independent_loops(network, engine=engine)
+    return LoopFinder(network, verbose=False, engine=engine).get_independent_loops()
+
+
+def _analyze_chunk(snapshots, n, engine, cache):
+    """Analyze a list of snapshots in a worker process."""
+    return [analyze_snapshot(snapshot, n=n, engine=engine, cache=cache)
+            for snapshot in snapshots]
+
+
+def analyze_many(snapshots, workers=None, chunk_size=4, max_pending=None, n=None,
+                 engine="tree", cache=None):
+    """
+    Find the independent loops of many independent snapshots using a pool of processes.
+
+    The snapshots are sent to the workers in chunks of `chunk_size`. At most `max_pending`
+    chunks are scheduled at any time, and the input is only read as far as needed to
+    schedule them, so the memory use does not grow with the number of snapshots as long as
+    the results are consumed as they come in. Bond files are read by the workers.
+
+    Args:
+        snapshots (iterable): Paths of bond files and/or bond arrays,
+            see :obj:`analyze_snapshot`. This can be a generator.
+        workers (int, optional): The number of worker processes. Defaults to the number
+            of CPUs. With 1 worker, the snapshots are analyzed in the calling process.
+        chunk_size (int, optional): The number of snapshots per task. Defaults to 4.
+        max_pending (int, optional): The maximum number of tasks that are scheduled
+            or running at any time. Defaults to twice the number of workers.
+        n (int, optional): The number of nodes of every snapshot.
+            See :obj:`analyze_snapshot`.
+        engine (str, optional): The search engine of the :obj:`LoopFinder`.
+        cache (:obj:`perconet.ResultCache`, optional): A cache of results that is shared
+            by all workers. See :obj:`analyze_snapshot`.
+
+    Yields:
+        Tuple[:obj:`numpy.ndarray`, int]: The independent loops of each snapshot and their
+        number, in the order of the input.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    snapshots = iter(snapshots)
+    if workers == 1:
+        for snapshot in snapshots:
+            yield analyze_snapshot(snapshot, n=n, engine=engine, cache=cache)
+        return
+    if max_pending is None:
+        max_pending = 2 * workers
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        while True:
+            while len(pending) < max_pending:
+                chunk = list(itertools.islice(snapshots, chunk_size))
+                if len(chunk) == 0:
+                    break
+                pending.append(executor.submit(_analyze_chunk, chunk, n, engine, cache))
+            if len(pending) == 0:
+                return
+            # the oldest task holds the next results in input order. later tasks keep
+            # the workers busy in the meantime
+            yield from pending.popleft().result()
@@ -0,0 +1,155 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import numpy as np
+
+
+class EdgeTable:
+    """
+    Compact storage for the edges of a :obj:`PeriodicNetwork`.
+
+    The two nodes and the boundary-crossing vector of every edge are stored in contiguous
+    integer arrays, indexed by edge number. The arrays have room for more edges than are
+    stored; when they are full, their capacity is doubled, so appending an edge takes
+    amortized constant time. With the default dtypes an edge takes (2 + dim) * 8 bytes.
+
+    Args:
+        dim (int, optional): Spatial dimension. Defaults to 3.
+        capacity (int, optional): The number of edges to allocate room for. Defaults to 16.
+        node_dtype (optional): The dtype of the node indices. Defaults to int.
+        crossing_dtype (optional): The dtype of the boundary-crossing vectors.
+            Defaults to int.
+    """
+    def __init__(self, dim=3, capacity=16, node_dtype=int, crossing_dtype=int):
+        self.dimension = dim
+        self.size = 0
+        self.nodes = np.zeros((max(capacity, 1), 2), dtype=node_dtype)
+        self.crossing = np.zeros((max(capacity, 1), dim), dtype=crossing_dtype)
+
+    @classmethod
+    def from_arrays(cls, node_pairs, crossing, node_dtype=int, crossing_dtype=int):
+        """
+        Construct an edge table that holds a copy of the given edges.
+
+        Args:
+            node_pairs (:obj:`numpy.ndarray`): Array with shape (E, 2) with the nodes of
+                each edge.
+            crossing (:obj:`numpy.ndarray`): Array with shape (E, dim) with the
+                boundary-crossing vector of each edge.
+
+        Returns:
+            :obj:`EdgeTable`: The new table, with a capacity of E edges.
+        """
+        table = cls(crossing.shape[1], capacity=len(node_pairs), node_dtype=node_dtype,
+                    crossing_dtype=crossing_dtype)
+        table.size = len(node_pairs)
+        table.nodes[:table.size] = node_pairs
+        table.crossing[:table.size] = crossing
+        return table
+
+    def __len__(self):
+        return self.size
+
+    def get_node_pairs(self):
+        """
+        Get the nodes of all edges.
+
+        Returns:
+            :obj:`numpy.ndarray`: A view with shape (E, 2) of the stored node pairs. It
+            remains valid while edges are appended, but not when edges are deleted.
+        """
+        return self.nodes[:self.size]
+
+    def get_crossing(self):
+        """
+        Get the boundary-crossing vectors of all edges.
+
+        Returns:
+            :obj:`numpy.ndarray`: A view with shape (E, dim) of the stored vectors. It
+            remains valid while edges are appended, but not when edges are deleted.
+        """
+        return self.crossing[:self.size]
+
+    def append(self, node1, node2, boundary_vector):
+        """
+        Append an edge, doubling the capacity if the table is full.
+
+        Returns:
+            int: The edge number of the new edge.
+        """
+        if self.size == len(self.nodes):
+            capacity = max(2 * len(self.nodes), 1)
+            nodes = np.zeros((capacity, 2), dtype=self.nodes.dtype)
+            crossing = np.zeros((capacity, self.dimension), dtype=self.crossing.dtype)
+            nodes[:self.size] = self.nodes[:self.size]
+            crossing[:self.size] = self.crossing[:self.size]
+            self.nodes = nodes
+            self.crossing = crossing
+        self.nodes[self.size] = (node1, node2)
+        self.crossing[self.size] = boundary_vector
+        self.size += 1
+        return self.size - 1
+
+    def delete(self, index):
+        """
+        Delete an edge in constant time: the last edge is moved into its place and takes
+        over its edge number.
+
+        Returns:
+            int: The former edge number of the moved edge, or -1 if the deleted edge was
+            the last one.
+        """
+        last = self.size - 1
+        self.size -= 1
+        if index == last:
+            return -1
+        self.nodes[index] = self.nodes[last]
+        self.crossing[index] = self.crossing[last]
+        return last
+
+    def find(self, node1, node2, boundary_vector, candidates=None):
+        """
+        Find the last edge from node1 to node2 with the given boundary-crossing vector,
+        or the same edge in the opposite direction.
+
+        Args:
+            candidates (:obj:`numpy.ndarray`, optional): If given, only these edge numbers
+                are searched.
+
+        Returns:
+            int: The edge number, or -1 if there is no such edge.
+        """
+        if candidates is None:
+            nodes = self.get_node_pairs()
+        else:
+            candidates = np.asarray(candidates, dtype=int)
+            nodes = self.nodes[candidates]
+        # compare the vectors only for the edges between the right nodes
+        same_nodes = np.nonzero(((nodes[:, 0] == node1) & (nodes[:, 1] == node2)) |
+                                ((nodes[:, 0] == node2) & (nodes[:, 1] == node1)))[0]
+        if candidates is not None:
+            same_nodes = candidates[same_nodes]
+        boundary_vector = np.asarray(boundary_vector)
+        nodes = self.nodes[same_nodes]
+        crossing = self.crossing[same_nodes]
+        forward = (nodes[:, 0] == node1) & np.all(crossing == boundary_vector, axis=1)
+        backward = (nodes[:, 0] == node2) & np.all(crossing == -boundary_vector, axis=1)
+        matches = same_nodes[forward | backward]
+        if len(matches) == 0:
+            return -1
+        return int(matches.max())
+
+    def nbytes(self):
+        """
+        Get the memory used by the table.
+
+        Returns:
+            int: The number of bytes allocated for the arrays (including unused capacity).
+        """
+        return self.nodes.nbytes + self.crossing.nbytes
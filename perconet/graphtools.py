@@ -0,0 +1,339 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import numpy as np
+
+
+def connected_components(n: int, node1: np.ndarray, node2: np.ndarray):
+    """
+    Find the connected components of a graph with n nodes and edges (node1[i], node2[i]).
+
+    Uses a vectorized union-find: in every round, the root of each edge endpoint is hooked
+    onto the smallest root it is connected to, followed by pointer jumping (path compression)
+    until every node points directly to its root. No recursion or per-edge Python work
+    is involved.
+
+    Returns:
+        :obj:`numpy.ndarray`: Array (dtype=int) with, for each node, the smallest node
+        index in its connected component.
+    """
+    parent = np.arange(n)
+    node1 = np.asarray(node1, dtype=int)
+    node2 = np.asarray(node2, dtype=int)
+    while True:
+        root1 = parent[node1]
+        root2 = parent[node2]
+        active = root1 != root2
+        if not np.any(active):
+            return parent
+        # edges within a single tree will remain so. drop them from the next rounds
+        node1 = node1[active]
+        node2 = node2[active]
+        root1 = root1[active]
+        root2 = root2[active]
+        np.minimum.at(parent, np.maximum(root1, root2), np.minimum(root1, root2))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def component_labels(n: int, node1: np.ndarray, node2: np.ndarray, method="auto"):
+    """
+    Label the connected components of a graph with n nodes and edges (node1[i], node2[i]).
+
+    Components are numbered in order of their smallest node index, so node 0 is always in
+    component 0 and the labels are the same as those of a sequential search over the nodes.
+
+    Args:
+        method (str, optional): "unionfind" uses :obj:`connected_components`; "scipy" uses
+            :obj:`scipy.sparse.csgraph.connected_components`. The default "auto" uses SciPy
+            if it is installed and the union-find otherwise.
+
+    Returns:
+        Tuple[:obj:`numpy.ndarray`, int]: The component label of every node and the
+        number of components.
+    """
+    if method == "auto":
+        try:
+            import scipy.sparse.csgraph  # noqa: F401
+            method = "scipy"
+        except ImportError:
+            method = "unionfind"
+    if method == "scipy":
+        # SciPy is an optional dependency
+        import scipy.sparse
+        import scipy.sparse.csgraph
+        adjacency = scipy.sparse.coo_matrix((np.ones(len(node1), dtype=np.int8),
+                                             (node1, node2)), shape=(n, n))
+        _, labels = scipy.sparse.csgraph.connected_components(adjacency, directed=False)
+        _, first, labels = np.unique(labels, return_index=True, return_inverse=True)
+        # renumber in order of the smallest node index of each component
+        rank = np.empty(len(first), dtype=int)
+        rank[np.argsort(first)] = np.arange(len(first))
+        labels = rank[labels]
+    elif method == "unionfind":
+        roots = connected_components(n, node1, node2)
+        # roots are the smallest node index of each component, so sorting them gives
+        # the right order
+        _, labels = np.unique(roots, return_inverse=True)
+    else:
+        raise ValueError(f"Unknown method {method}. Use 'auto', 'unionfind' or 'scipy'.")
+    labels = labels.reshape(-1)
+    return labels, int(np.amax(labels)) + 1
+
+
+def sort_half_edges(node1, node2, crossing, n):
+    """
+    Convert edge arrays to compressed-sparse-row (CSR) adjacency arrays.
+
+    Every edge is stored once for node1 and (unless it is a self-bond) once for node2,
+    with inverted boundary crossing. The resulting half-edges are sorted by node and then
+    by edge number, which is the order in which :obj:`PeriodicNetwork.add_edge` fills the
+    neighbor slots of each node.
+
+    Returns:
+        Tuple of :obj:`numpy.ndarray`: (src, dst, edge_ids, crossing, offsets), where the
+        half-edges of node i are at positions offsets[i] up to (but not including) offsets[i+1].
+    """
+    edge_ids = np.arange(len(node1))
+    not_self = node1 != node2
+    src = np.concatenate((node1, node2[not_self]))
+    dst = np.concatenate((node2, node1[not_self]))
+    half_edge_ids = np.concatenate((edge_ids, edge_ids[not_self]))
+    half_crossing = np.concatenate((crossing, -crossing[not_self]))
+    order = np.lexsort((half_edge_ids, src))
+    src = src[order]
+    offsets = np.zeros(n + 1, dtype=int)
+    np.cumsum(np.bincount(src, minlength=n), out=offsets[1:])
+    return src, dst[order], half_edge_ids[order], half_crossing[order], offsets
+
+
+def _half_edges_of(offsets, nodes):
+    """
+    Get the positions in CSR arrays of all half-edges starting at the given nodes.
+
+    Returns:
+        Tuple[:obj:`numpy.ndarray`, :obj:`numpy.ndarray`]: The positions, grouped by node
+        in the order of `nodes`, and the number of half-edges of each node.
+    """
+    counts = np.diff(offsets)[nodes]
+    starts = np.repeat(offsets[nodes] - np.cumsum(counts) + counts, counts)
+    return starts + np.arange(len(starts)), counts
+
+
+def spanning_forest(offsets, neighbors, crossing, roots):
+    """
+    Construct a breadth-first spanning forest of a graph in CSR form
+    (see :obj:`perconet.PeriodicNetwork.get_csr`) and the potential of each node.
+
+    The potential of a node is the sum of the boundary-crossing vectors along the
+    tree path from the root of its component to that node. The search advances all
+    components simultaneously, one BFS level per iteration, using only array operations.
+
+    Args:
+        offsets, neighbors, crossing (:obj:`numpy.ndarray`): CSR adjacency arrays
+        roots (:obj:`numpy.ndarray`): One node per connected component to start from
+
+    Returns:
+        Tuple[:obj:`numpy.ndarray`, :obj:`numpy.ndarray`]: (potential, parent_index), with
+        potential an (n, dim) array and parent_index the position in the CSR arrays of the
+        tree edge through which each node was reached (-1 for roots).
+    """
+    n = len(offsets) - 1
+    potential = np.zeros((n, crossing.shape[1]), dtype=np.int64)
+    parent_index = -1 * np.ones(n, dtype=int)
+    visited = np.zeros(n, dtype=bool)
+    frontier = np.asarray(roots, dtype=int)
+    visited[frontier] = True
+    while len(frontier) > 0:
+        index, counts = _half_edges_of(offsets, frontier)
+        if len(index) == 0:
+            break
+        targets = neighbors[index]
+        new = ~visited[targets]
+        index = index[new]
+        targets = targets[new]
+        # a node can be reached by several frontier nodes. keep the first one
+        targets, first = np.unique(targets, return_index=True)
+        index = index[first]
+        sources = np.repeat(frontier, counts)[new][first]
+        visited[targets] = True
+        parent_index[targets] = index
+        potential[targets] = potential[sources] + crossing[index]
+        frontier = targets
+    return potential, parent_index
+
+
+def peel_leaves(n: int, node1: np.ndarray, node2: np.ndarray):
+    """
+    Repeatedly remove nodes with a single edge (leaves) from a graph, together with that
+    edge, until no leaves are left. This removes all tree-like branches of the graph.
+
+    All current leaves are removed at the same time, so the number of iterations is the
+    length of the longest dangling chain.
+
+    Returns:
+        :obj:`numpy.ndarray`: Boolean array with one element per edge, which is False
+        for the removed edges.
+    """
+    node1 = np.asarray(node1, dtype=int)
+    node2 = np.asarray(node2, dtype=int)
+    _, _, edges, _, offsets = sort_half_edges(node1, node2, np.zeros((len(node1), 0)), n)
+    alive = np.ones(len(node1), dtype=bool)
+    # a self-loop counts twice, so its node is never a leaf
+    degree = np.bincount(node1, minlength=n) + np.bincount(node2, minlength=n)
+    frontier = np.nonzero(degree == 1)[0]
+    while len(frontier) > 0:
+        index, _ = _half_edges_of(offsets, frontier)
+        # two leaves can share their edge
+        removed = np.unique(edges[index][alive[edges[index]]])
+        alive[removed] = False
+        ends = np.concatenate((node1[removed], node2[removed]))
+        np.subtract.at(degree, ends, 1)
+        frontier = np.unique(ends[degree[ends] == 1])
+    return alive
+
+
+def find_bridges(n: int, node1: np.ndarray, node2: np.ndarray):
+    """
+    Find the bridges of a graph: the edges that are not part of any cycle.
+
+    Every bridge is part of any spanning forest. A tree edge from node x to its parent
+    lies on a cycle if and only if some edge outside the forest connects the subtree of x
+    to the rest of the graph. This is counted by adding 1 at both endpoints of every
+    non-tree edge and -2 at their lowest common ancestor (found by binary lifting), and
+    summing over subtrees, one tree level at a time.
+
+    Returns:
+        :obj:`numpy.ndarray`: Boolean array with one element per edge, which is True
+        for the bridges.
+    """
+    node1 = np.asarray(node1, dtype=int)
+    node2 = np.asarray(node2, dtype=int)
+    src, neighbors, edges, crossing, offsets = \
+        sort_half_edges(node1, node2, np.zeros((len(node1), 0), dtype=int), n)
+    roots = connected_components(n, node1, node2)
+    roots = np.nonzero(roots == np.arange(n))[0]
+    _, parent_index = spanning_forest(offsets, neighbors, crossing, roots)
+    has_parent = parent_index >= 0
+    parent = np.arange(n)
+    parent[has_parent] = src[parent_index[has_parent]]
+    tree_edge = edges[parent_index[has_parent]]
+    is_tree_edge = np.zeros(len(node1), dtype=bool)
+    is_tree_edge[tree_edge] = True
+
+    # depth of every node and the table of 2**k-th ancestors, by pointer jumping
+    depth = has_parent.astype(int)
+    ancestors = [parent]
+    jump = parent
+    while np.any(jump[jump] != jump):
+        depth = depth + depth[jump]
+        jump = jump[jump]
+        ancestors.append(jump)
+
+    # lowest common ancestors of the endpoints of all non-tree edges
+    lower = node1[~is_tree_edge]
+    upper = node2[~is_tree_edge]
+    coverage = np.bincount(lower, minlength=n) + np.bincount(upper, minlength=n)
+    swap = depth[lower] < depth[upper]
+    lower, upper = np.where(swap, upper, lower), np.where(swap, lower, upper)
+    difference = depth[lower] - depth[upper]
+    for k, ancestor in enumerate(ancestors):
+        lift = (difference >> k) & 1 == 1
+        lower[lift] = ancestor[lower[lift]]
+    for ancestor in reversed(ancestors):
+        differ = ancestor[lower] != ancestor[upper]
+        lower[differ] = ancestor[lower[differ]]
+        upper[differ] = ancestor[upper[differ]]
+    common = np.where(lower == upper, lower, parent[lower])
+    np.subtract.at(coverage, common, 2)
+
+    # sum over subtrees, starting at the deepest level
+    order = np.argsort(depth, kind="stable")
+    level_starts = np.searchsorted(depth[order], np.arange(depth.max() + 2))
+    for level in range(depth.max(), 0, -1):
+        nodes = order[level_starts[level]:level_starts[level + 1]]
+        np.add.at(coverage, parent[nodes], coverage[nodes])
+    is_bridge = np.zeros(len(node1), dtype=bool)
+    is_bridge[tree_edge] = coverage[has_parent] == 0
+    return is_bridge
+
+
+def contract_chains(n: int, node1: np.ndarray, node2: np.ndarray, crossing: np.ndarray):
+    """
+    Contract every chain of nodes with exactly two edges into a single edge.
+
+    The boundary-crossing vector of the new edge is the sum of those along the chain, so
+    the contracted graph has the same loops. Nodes with a self-loop are not contracted.
+    A closed ring of such nodes is replaced by its root (the node with the smallest index)
+    with a self-loop that carries the loop vector of the ring.
+
+    The chains are followed with pointer jumping over the half-edges: a half-edge that
+    enters a chain node continues with the other half-edge that leaves it. Every round
+    doubles the distance covered, so the number of rounds is logarithmic in the length
+    of the longest chain.
+
+    Returns:
+        Tuple of :obj:`numpy.ndarray`: (node1, node2, crossing, is_removed), with the edges
+        of the contracted graph in terms of the original node numbers, and a boolean array
+        that is True for the nodes that were contracted away. The edges that are not
+        part of a chain come first, in their original order.
+    """
+    node1 = np.asarray(node1, dtype=int)
+    node2 = np.asarray(node2, dtype=int)
+    crossing = np.asarray(crossing, dtype=np.int64)
+    degree = np.bincount(node1, minlength=n) + np.bincount(node2, minlength=n)
+    has_self_loop = np.zeros(n, dtype=bool)
+    has_self_loop[node1[node1 == node2]] = True
+    inner = (degree == 2) & ~has_self_loop
+    # rings are connected components of inner nodes without edges to other nodes
+    in_chain = inner[node1] & inner[node2]
+    component = connected_components(n, node1[in_chain], node2[in_chain])
+    is_open = np.zeros(n, dtype=bool)
+    is_open[component[np.where(inner[node1], node1, node2)[inner[node1] != inner[node2]]]] = True
+    is_ring_root = inner & (component == np.arange(n)) & ~is_open
+
+    # half-edge 2 * i goes from node1[i] to node2[i], half-edge 2 * i + 1 goes back
+    src = np.stack((node1, node2), axis=1).reshape(-1)
+    dst = np.stack((node2, node1), axis=1).reshape(-1)
+    total = np.stack((crossing, -crossing), axis=1).reshape(-1, crossing.shape[1])
+    # the two half-edges that leave each inner node
+    leaving = np.nonzero(inner[src])[0]
+    leaving = leaving[np.argsort(src[leaving], kind="stable")]
+    out_first = -1 * np.ones(n, dtype=int)
+    out_second = -1 * np.ones(n, dtype=int)
+    out_first[src[leaving[0::2]]] = leaving[0::2]
+    out_second[src[leaving[1::2]]] = leaving[1::2]
+    # a walk stops when it leaves the chain or returns to the root of a ring
+    next_half_edge = -1 * np.ones(len(src), dtype=int)
+    active = np.nonzero(inner[dst] & ~is_ring_root[dst])[0]
+    target = dst[active]
+    next_half_edge[active] = np.where(out_first[target] == active ^ 1,
+                                      out_second[target], out_first[target])
+    # total[h] becomes the summed crossing of the walk starting with h,
+    # last[h] the last half-edge of that walk
+    last = np.arange(len(src))
+    while len(active) > 0:
+        jump = next_half_edge[active]
+        total[active] += total[jump]
+        last[active] = last[jump]
+        next_half_edge[active] = next_half_edge[jump]
+        active = active[next_half_edge[active] >= 0]
+
+    # each open chain is walked in both directions. keep one
+    start = np.nonzero(inner[dst] & ~inner[src])[0]
+    start = start[start < last[start] ^ 1]
+    ring_roots = np.nonzero(is_ring_root)[0]
+    keep = ~inner[node1] & ~inner[node2]
+    return (np.concatenate((node1[keep], src[start], ring_roots)),
+            np.concatenate((node2[keep], dst[last[start]], ring_roots)),
+            np.concatenate((crossing[keep], total[start], total[out_first[ring_roots]])),
+            inner & ~is_ring_root)
@@ -10,73 +10,309 @@
 import numpy as np
 # import sympy
 import perconet.looptools as looptools
+import perconet.graphtools as graphtools
+
+
+class _SearchState:
+    """
+    The state of a single search of a reduced network, see :obj:`LoopFinder`.
+
+    Args:
+        reduced_network (:obj:`perconet.PeriodicNetwork`): The network to search.
+    """
+    def __init__(self, reduced_network):
+        self.reduced_network = reduced_network
+        self.potential = None
+        # the numbers of edges and nodes removed by pruning, see LoopFinder.pruned
+        self.pruned = None
+
+    def allocate_dfs(self, chunk_size):
+        """Allocate the arrays for a depth-first search with a buffer of chunk_size loops."""
+        dim = self.reduced_network.get_dimension()
+        n_nodes = self.reduced_network.get_number_of_nodes()
+        n_edges = self.reduced_network.get_number_of_edges()
+        offsets, _, _, _ = self.reduced_network.get_csr()
+        self.visited_nodes = np.zeros(n_nodes, dtype=bool)
+        self.visited_edges = np.zeros(n_edges, dtype=bool)
+        self.potential = np.zeros((n_nodes, dim), dtype=np.int64)
+        self.parent_edge = -1 * np.ones(n_nodes, dtype=int)
+        self.next_index = offsets[:-1].copy()
+        self.stack = np.zeros(n_nodes, dtype=int)
+        self.loop_nodes = np.zeros(chunk_size, dtype=int)
+        self.loop_indices = np.zeros(chunk_size, dtype=int)
+        self.n_loops = 0
 
 
 class LoopFinder:
     """
-    Class implementing a depth-first search to determine the percolation directions of the network.
+    Class implementing a graph search to determine the percolation directions of the network.
+
+    Two search engines are available. Both find one loop for every edge that is not part
+    of a spanning forest of the (reduced) network, so they give the same independent loops:
+
+    * "tree" (the default): builds a breadth-first spanning forest with array operations
+      and computes every loop vector as potential(u) + crossing(u->v) - potential(v)
+      in a single vectorized pass over the edges.
+    * "dfs": a depth-first search that visits the edges one by one.
+
+    The state of a search is not stored in the :obj:`LoopFinder`, so one instance (and one
+    :obj:`PeriodicNetwork`) can be used by several threads at the same time, as long as the
+    network is not modified meanwhile.
 
     Args:
         network (:obj:`perconet.PeriodicNetwork`): A PeriodicNetwork object representing
             the graph to analyze.
         verbose (bool, optional): Generate verbose output to stdout (to be replaced by
             Logging in future release)
+        engine (str, optional): The search engine, "tree" (default) or "dfs".
+        edge_mask (:obj:`numpy.ndarray`, optional): Analyze only the subnetwork of the edges
+            selected by this boolean mask (see :obj:`PeriodicNetwork.check_edge_mask`),
+            without copying the network.
+        prune (bool, optional): Defaults to False. If true, the reduced network is replaced
+            by its 2-edge-connected core (see :obj:`PeriodicNetwork.get_core_network`) before
+            it is searched. This gives the same loops, but the search skips dangling
+            branches. The numbers of pruned edges and nodes are available as `pruned`.
+        contract_chains (bool, optional): Defaults to False. If true, chains of nodes with
+            two edges in the reduced network are contracted into single edges before the
+            search (see :obj:`PeriodicNetwork.get_reduced_network`). This gives the same
+            independent loops from a smaller graph.
     """
-    def __init__(self, network, verbose=True):
+    def __init__(self, network, verbose=True, engine="tree", edge_mask=None, prune=False,
+                 contract_chains=False):
+        if engine not in ("tree", "dfs"):
+            raise ValueError(f"Unknown engine {engine}. Use 'tree' or 'dfs'.")
         self.network = network
+        self.edge_mask = network.check_edge_mask(edge_mask)
+        self.prune = prune
+        self.contract_chains = contract_chains
         self.verbose = verbose
-        # moved all dfs-specific variable initializations to get_loops()
-        # to make sure that they get re-initialized if get_loops is called more than once
+        self.engine = engine
+        # The search state is kept in a _SearchState object per call, not on self, so one
+        # instance can be used for several searches at the same time (e.g. from threads)
 
-    def __dfs(self, start):
-        # in here, get network info whenever using self.reduced_network.get_blabla()
-        # this function can be private (not callable from the outside)
-        self.visited_nodes[start] = self.discovery_time_node
+    def __dfs(self, state, root):
+        """
+        Depth-first search of the connected component of root, using an explicit stack.
 
-        # print ("crossing sum now: \n", self.crossing_sum , "\n visited nodes: ",
-        #         self.visited_nodes, "\n visited edges: \n", self.visited_edges)
-        if self.verbose:
-            print("number of neighbours: ", self.reduced_network.get_number_of_neighbors(start),
-                  "start: ", start)
+        Fills the node potentials (the cumulative boundary crossing along the search tree)
+        and records every edge that closes a loop. The search state lives in arrays that are
+        allocated once in :obj:`__dfs_search`, so deep components do not run into the recursion
+        limit and the search does not allocate per step.
 
-        for n_index in range(self.reduced_network.get_number_of_neighbors(start)):  # fix this
-            neigh = self.reduced_network.get_neighbor(start, n_index)
-            edge = self.reduced_network.get_edge(start, n_index)
+        This is a generator that yields an array of loops whenever the loop buffer is full.
+        """
+        offsets, neighbors, edges, crossing = state.reduced_network.get_csr()
+        next_index = state.next_index
+        stack = state.stack
+        stack[0] = root
+        stack_pointer = 1
+        state.visited_nodes[root] = True
+        state.potential[root, :] = 0
+        while stack_pointer > 0:
+            node = stack[stack_pointer - 1]
+            index = next_index[node]
+            if index == offsets[node + 1]:
+                # all edges of this node have been handled. return to its parent
+                stack_pointer -= 1
+                continue
+            next_index[node] = index + 1
+            edge = edges[index]
+            if state.visited_edges[edge]:  # this is the edge we came in through
+                continue
+            state.visited_edges[edge] = True
+            neigh = neighbors[index]
             if self.verbose:
-                print("edge", edge)
-            if edge == -1:
-                break
+                print("edge", edge, "from", node, "to", neigh)
+            if not state.visited_nodes[neigh]:
+                # extend the search tree
+                state.visited_nodes[neigh] = True
+                state.parent_edge[neigh] = index
+                np.add(state.potential[node], crossing[index], out=state.potential[neigh])
+                stack[stack_pointer] = neigh
+                stack_pointer += 1
+            else:  # we found a loop!
+                # only store where the loop closes. The loop vectors are computed
+                # from the potentials when the buffer is flushed.
+                state.loop_nodes[state.n_loops] = node
+                state.loop_indices[state.n_loops] = index
+                state.n_loops += 1
+                if state.n_loops == len(state.loop_nodes):
+                    yield self.__flush_loops(state)
+
+    def __flush_loops(self, state):
+        """Compute the loop vectors of the loops in the buffer and empty the buffer."""
+        _, neighbors, _, crossing = state.reduced_network.get_csr()
+        loop_nodes = state.loop_nodes[:state.n_loops]
+        loop_indices = state.loop_indices[:state.n_loops]
+        loops = state.potential[loop_nodes] + crossing[loop_indices] - \
+            state.potential[neighbors[loop_indices]]
+        state.n_loops = 0
+        return loops
+
+    def __dfs_search(self, state, chunk_size):
+        """
+        Generator yielding the loops of the reduced network found by depth-first search,
+        in arrays of at most chunk_size loops. The search only proceeds as far as needed
+        to produce the next chunk.
+        """
+        n_nodes = state.reduced_network.get_number_of_nodes()
+        # allocate the search state once for all components
+        state.allocate_dfs(chunk_size)
+        for node in range(n_nodes):
+            # If this node has not been visited, this is a new cluster and we start a fresh search
+            if not state.visited_nodes[node]:
+                if self.verbose:
+                    print("new origin of network: ", node)
+                yield from self.__dfs(state, node)
+        if state.n_loops > 0:
+            yield self.__flush_loops(state)
+
+    def __dfs_loops(self, state):
+        """Find the loops of the reduced network using the depth-first search engine."""
+        # every loop is closed by a different edge so there are at most n_edges loops
+        n_edges = state.reduced_network.get_number_of_edges()
+        loops = list(self.__dfs_search(state, max(n_edges, 1)))
+        if len(loops) == 0:
+            return np.zeros((0, state.reduced_network.get_dimension()), dtype=int)
+        return loops[0]
+
+    def __tree_loops(self, state):
+        """Find the loops of the reduced network using the spanning-tree engine."""
+        n_nodes = state.reduced_network.get_number_of_nodes()
+        offsets, neighbors, edges, crossing = state.reduced_network.get_csr()
+        node_pairs, edge_crossing = state.reduced_network.get_edge_arrays()
+        # start one tree in every connected component
+        roots = graphtools.connected_components(n_nodes, node_pairs[:, 0], node_pairs[:, 1])
+        roots = np.nonzero(roots == np.arange(n_nodes))[0]
+        if self.verbose:
+            print("origins of network: ", roots)
+        state.potential, parent_index = graphtools.spanning_forest(offsets, neighbors,
+                                                                   crossing, roots)
+        # every edge that is not part of the spanning forest closes a loop
+        closes_loop = np.ones(len(node_pairs), dtype=bool)
+        closes_loop[edges[parent_index[parent_index >= 0]]] = False
+        node1 = node_pairs[closes_loop, 0]
+        node2 = node_pairs[closes_loop, 1]
+        return state.potential[node1] + edge_crossing[closes_loop] - state.potential[node2]
+
+    def get_loop_array(self):
+        """
+        Generate the raw boundary-crossing loops as an array.
+        Most use cases will require :obj:`get_independent_loops()` instead.
+
+        See :obj:`get_loops()` for details. This method avoids converting the loops to
+        Python lists, which matters for large networks.
+
+        Returns:
+            :obj:`numpy.ndarray`: Array (dtype=int) with shape (L, dim), with one row per loop
+            containing the number of times each boundary is crossed by that loop.
+        """
+        loops, _ = self.__cached("loops", self.__find_loops)
+        return loops
+
+    @property
+    def pruned(self):
+        """
+        dict: The numbers of "leaf_edges", "bridges" and "nodes" that were pruned from the
+        reduced network before it was searched (see :obj:`PeriodicNetwork.get_core_network`),
+        or None if `prune` is not set or the network has no boundary-crossing edges.
+        This is part of the cached result of :obj:`get_loop_array`.
+        """
+        _, pruned = self.__cached("loops", self.__find_loops)
+        return pruned
+
+    def __find_loops(self):
+        """Search the network, see :obj:`get_loop_array`. Returns the loops and `pruned`."""
+        batches = [np.zeros((0, self.network.get_dimension()), dtype=int)]
+        pruned = None
+        if self.__has_boundary_edges():
+            state, harvested_loops = self.__reduce()
+            batches += [harvested_loops, self.__search(state)]
+            pruned = state.pruned
+        loops = np.concatenate(batches)
+        if self.verbose:
+            print("loops: ", loops)
+        return loops, pruned
+
+    def __has_boundary_edges(self):
+        """Check if any of the (selected) edges crosses a boundary."""
+        if self.edge_mask is None:
+            return self.network.n_boundary_edges > 0
+        _, crossing = self.network.get_edge_arrays()
+        return bool(np.any(np.any(crossing != 0, axis=1) & self.edge_mask))
 
-            if self.visited_edges[edge] == -1:  # otherwhise neigh is a parent of start
-                self.visited_edges[edge] = self.discovery_time_edge
-                ("visited edges now: ", self.visited_edges)
-                self.discovery_time_edge += 1
-                timestep = self.visited_nodes[start]
-
-                current_crossing = self.crossing_sum[timestep] + \
-                    self.reduced_network.get_boundary_crossing(start, n_index)
-                # print(f"this bond: {self.reduced_network.get_boundary_crossing(start, n_index)}")
-                # print(f"    Total for {start}-{neigh} (index: {n_index}): {current_crossing}.")
-
-                if self.visited_nodes[neigh] == -1:
-                    self.discovery_time_node += 1
-                    self.crossing_sum.append(current_crossing)
-                    # print ("visited nodes: \n",visited_nodes, "\n crossing sum \n", crossing_sum)
-                    # loops_temp, discovery_timeC, discovery_timeE = dfs (neigh, discovery_timeC,
-                    #  discovery_timeE, neighbors, visited_nodes, current_crossing, crossing_sum,
-                    # boundary_crossing, edges_list, visited_edges, loops_temp, Nclusters)
-                    self.__dfs(neigh)  # find right one
-                    # print ("crossing sum now: \n", crossing_sum, "loops temp is:", loops_temp)
-                else:  # we found a loop!
-                    loop_timestep = self.visited_nodes[neigh]
-                    loop = current_crossing - self.crossing_sum[loop_timestep]
-
-                    self.loops_temp.append(loop.tolist())
-                    current_crossing -= self.reduced_network.get_boundary_crossing(start, n_index)
-                    if self.verbose:
-                        print("loop!  -> ", self.loops_temp, " loop_timestep: ", loop_timestep,
-                              ", crossing sum: ", self.crossing_sum)
-        return
+    def __cached(self, name, compute, *args):
+        """
+        Cache a result on the network, unless only part of it is analyzed. The raw loops and
+        `pruned` depend on the settings of the search, so these are part of the key.
+        """
+        if self.edge_mask is None:
+            key = (name, self.engine, self.prune, self.contract_chains) + args
+            return self.network.cached_result(key, compute)
+        return compute()
+
+    def __reduce(self):
+        """
+        Set up the reduced network that is to be searched.
+
+        Returns:
+            Tuple[_SearchState, :obj:`numpy.ndarray`]: The state of a new search of the
+            reduced network and the loops that were harvested during the reduction.
+        """
+        # self-loops and parallel edges of the reduced network are loops by themselves.
+        # only the remaining graph needs to be searched
+        reduced_network, harvested_loops = \
+            self.network.get_reduced_network(harvest_loops=True, edge_mask=self.edge_mask,
+                                             contract_chains=self.contract_chains)
+        pruned = None
+        if self.prune:
+            reduced_network, pruned = reduced_network.get_core_network()
+        state = _SearchState(reduced_network)
+        state.pruned = pruned
+        return state, harvested_loops
+
+    def __search(self, state):
+        """Find the loops of the reduced network with the chosen search engine."""
+        if self.engine == "dfs":
+            return self.__dfs_loops(state)
+        return self.__tree_loops(state)
+
+    def __loop_batches(self):
+        """
+        Generator yielding first the loops harvested during the reduction of the network
+        and then the loops found by the search engine, so callers can stop before the search.
+        """
+        if not self.__has_boundary_edges():
+            # no edges around boundaries. no loops
+            return
+        state, harvested_loops = self.__reduce()
+        yield harvested_loops
+        yield self.__search(state)
+
+    def iter_loops(self, chunk_size=64):
+        """
+        Generate the raw boundary-crossing loops one chunk at a time.
+
+        Loops that are found while reducing the network (see
+        :obj:`PeriodicNetwork.get_reduced_network`) come first, followed by the loops
+        found by a depth-first search of the reduced network, regardless of the engine
+        chosen for this :obj:`LoopFinder`. The search only proceeds when the next chunk is
+        requested, so a caller that stops iterating early does not search the entire network.
+        Every iterator has its own search state, so several can be used at the same time.
+
+        Args:
+            chunk_size (int, optional): The maximum number of loops per chunk. Defaults to 64.
+
+        Yields:
+            :obj:`numpy.ndarray`: Array (dtype=int) with shape (L, dim), L <= chunk_size,
+            with one row per loop.
+        """
+        if not self.__has_boundary_edges():
+            return
+        state, harvested_loops = self.__reduce()
+        for start in range(0, len(harvested_loops), chunk_size):
+            yield harvested_loops[start:start + chunk_size]
+        yield from self.__dfs_search(state, chunk_size)
 
     def get_loops(self):
         """
@@ -96,51 +332,29 @@ class LoopFinder:
                 is itself a list of the number of times each boundary is
                 crossed by that loop.
         """
+        return self.get_loop_array().tolist()
 
-        if self.network.n_boundary_edges == 0:
-            # no edges around boundaries. return empty list immediately
-            return []
-
-        self.reduced_network = self.network.get_reduced_network()
-        dim = self.reduced_network.get_dimension()
-        self.discovery_time_node = 0
-        self.discovery_time_edge = 0
-        self.visited_nodes = -1 * np.ones(self.reduced_network.number_of_nodes, dtype=int)
-        self.visited_edges = -1 * np.ones(np.amax(self.reduced_network.edges_list) + 1, dtype=int)
-        self.loops_list = []
-        # print(f"Number of nodes after reduction: {network.get_number_of_nodes()}.")
-
-        # starting_nodes_with_loops = 0
-        for node in range(self.reduced_network.number_of_nodes):
-            # If this node has not been visited, this is a new cluster and we start a fresh search
-            if self.visited_nodes[node] == -1:
-                if self.verbose:
-                    print("new origin of network: ", node)
-                # reset variables used during search to 0
-                # initialize a python list of numpy arrays to keep track of the
-                # cumulative boundary-crossing vector with a zero vector as first element
-                self.crossing_sum = [np.zeros(dim, dtype=int)]
-
-                self.loops_temp = []
-                self.discovery_time_node = 0
-                self.discovery_time_edge = 0
-                # enter the recursive search
-                self.__dfs(node)
-
-                self.discovery_time_node += 1
-                if self.loops_temp:
-                    # starting_nodes_with_loops += 1
-                    self.loops_list.extend(self.loops_temp)
-        # print(f"Loops found from {starting_nodes_with_loops} starting points")
-        # assert starting_nodes_with_loops < 2
-        return self.loops_list
-
-    def get_independent_loops(self):
+    def get_independent_loops(self, streaming=False):
         """
         Generate a list of all linearly independent topologically nontrivial loops.
 
         The list is returned in Hermite normal form. See :ref:`Loop independence` for details.
 
+        Args:
+            streaming (bool, optional): Defaults to False. If true, the loops produced
+                by :obj:`iter_loops` are added one chunk at a time to a running basis of at
+                most dim loops, and the search stops as soon as the basis spans all integer
+                vectors (its Hermite normal form is the identity matrix), because further
+                loops can not change it then. This gives the same result with a bounded
+                amount of memory, and is much faster for networks that percolate in all
+                directions with loops that wrap around each boundary once.
+
+        The result is cached on the network until it is modified
+        (see :obj:`PeriodicNetwork.cached_result`), unless an `edge_mask` is used. Once an
+        edge has been removed from the network, the loops are taken from its
+        :obj:`TrajectoryAnalyzer`, which only searches the parts of the network that changed
+        (see :obj:`PeriodicNetwork.remove_edge`).
+
         Returns:
             Tuple[:obj:`List` of :obj:`List` of int, int]:
                 (list, int) A tuple containing a list of the independent loops
@@ -154,7 +368,27 @@ class LoopFinder:
         # Note that we have not yet encountered data for which this difference mattered
         # and if all one wants to know is the weak directions of a material it
         # is irrelevant anyway
-        myloops_list = np.asarray(self.get_loops())
+        if self.edge_mask is None and self.network.trajectory_analyzer is not None:
+            return self.network.trajectory_analyzer.get_independent_loops()
+        return self.__cached("independent_loops", lambda: self.__independent_loops(streaming),
+                             streaming)
+
+    def __independent_loops(self, streaming):
+        """Find the independent loops, see :obj:`get_independent_loops`."""
+        if streaming:
+            dim = self.network.get_dimension()
+            basis = np.zeros((0, dim), dtype=int)
+            for loops in self.iter_loops():
+                basis = looptools.extend_basis(basis, loops)
+                # a basis of full rank can still span a sublattice (e.g. [[2]]), which
+                # further loops can refine. only the identity can not be refined
+                if len(basis) == dim and np.prod(np.abs(np.diag(basis))) == 1:
+                    break
+            if self.verbose:
+                print(f"Found {len(basis)} loops")
+                print(basis)
+            return basis, len(basis)
+        myloops_list = self.get_loop_array()
         if len(myloops_list) == 0:
             # No loops found
             return myloops_list, 0
@@ -164,15 +398,51 @@ class LoopFinder:
         if self.verbose:
             print("loops list: ", myloops_list)
             print(f"rank according to numpy.linalg {np.linalg.matrix_rank(myloops_list, tol=1e-8)}")
-        independent_loops, _, Nloops = looptools.hermite_normal_form(myloops_list)
-        # the ige method has left the 0-rows in there so need to remove them now
-        independent_loops = independent_loops[:Nloops]
+        # the transformation matrix is not needed, and would be a square matrix
+        # with the number of raw loops as its size
+        independent_loops, _, Nloops = \
+            looptools.hermite_normal_form(myloops_list, compute_transform=False)
 
         if self.verbose:
             print(f"Found {Nloops} loops")
             print(independent_loops)
         return independent_loops, Nloops
 
+    def get_percolation_dimension(self):
+        """
+        Get the number of independent directions in which the network percolates.
+
+        This equals the number of loops returned by :obj:`get_independent_loops()`, but is
+        computed with :obj:`looptools.integer_rank`, which skips the construction of the
+        Hermite normal form. If the loops found while reducing the network already span
+        all directions, the search of the reduced network is skipped as well.
+
+        Like the independent loops, the result is cached on the network until it is
+        modified (see :obj:`PeriodicNetwork.cached_result`), unless an `edge_mask` is used,
+        and taken from the :obj:`TrajectoryAnalyzer` of the network once an edge has been
+        removed.
+
+        Returns:
+            int: The rank of the lattice of boundary-crossing loops.
+        """
+        if self.edge_mask is None and self.network.trajectory_analyzer is not None:
+            return self.network.trajectory_analyzer.get_independent_loops()[1]
+        return self.__cached("percolation_dimension", self.__percolation_dimension)
+
+    def __percolation_dimension(self):
+        """Find the percolation dimension, see :obj:`get_percolation_dimension`."""
+        dim = self.network.get_dimension()
+        loops = np.zeros((0, dim), dtype=int)
+        rank = 0
+        for batch in self.__loop_batches():
+            loops = np.concatenate((loops, batch))
+            rank = looptools.integer_rank(loops)
+            if rank == dim:
+                break
+        if self.verbose:
+            print(f"Percolation dimension: {rank}")
+        return rank
+
     def _compare_independence_methods(self):
         """
         Checks if ranks obtained with three methods agree.
@@ -9,6 +9,14 @@
 
 import numpy as np
 
+# Fixed-width integer arithmetic is used as long as all entries that can arise in a row
+# operation stay below this bound. Otherwise the elimination is redone with Python integers.
+# The bound assumes np.int64, which is used explicitly because the default integer
+# is only 32 bits wide on some platforms.
+SAFE_BOUND = 2**62
+# Number of times hermite_normal_form had to fall back to Python integers
+slow_path_count = 0
+
 
 def swaprows(a: np.ndarray, i1: int, i2: int):
     """
@@ -19,6 +27,19 @@ def swaprows(a: np.ndarray, i1: int, i2: int):
     a[(i1, i2), :] = a[(i2, i1), :]
 
 
+def _check_row_update(mat, q, source):
+    """
+    Raise OverflowError if subtracting q times the source row(s) from rows of the
+    fixed-width integer matrix mat could exceed :obj:`SAFE_BOUND`.
+    """
+    if mat.dtype == object:
+        return
+    largest = int(np.max(np.abs(q), initial=0)) * int(np.max(np.abs(source), initial=0)) + \
+        int(np.max(np.abs(mat), initial=0))
+    if largest >= SAFE_BOUND:
+        raise OverflowError("Integer overflow in row operation")
+
+
 def multiply_row(mat, shadow=None, row=0, factor=1):
     """
     Mutiply row of matrix mat by factor. Note that the only nontrivial
@@ -42,36 +63,38 @@ def reduce_row(mat, shadow=None, pivot_col=0, source_row=0, target_row=0):
     If set, apply the same transformation to the shadow matrix.
     This is useful to keep track of the transformation matrix representing
     the elimination result.
+
+    Raises:
+        OverflowError: if the result might not fit in the (fixed-width) integer type of mat.
+            Matrices with dtype=object (Python integers) are never checked.
     """
     if target_row == source_row:
         return
     q = mat[target_row, pivot_col] // mat[source_row, pivot_col]  # integer division
     if q != 0:
+        _check_row_update(mat[target_row, :], q, mat[source_row, :])
+        if isinstance(shadow, np.ndarray):
+            _check_row_update(shadow[target_row, :], q, shadow[source_row, :])
         # update matrix a and keep track of the corresponding transformation matrix
         mat[target_row, :] -= q * mat[source_row, :]
         if isinstance(shadow, np.ndarray):
             shadow[target_row, :] -= q * shadow[source_row, :]
 
 
-def hermite_normal_form(input: np.ndarray):
+def _hermite_normal_form_inplace(a: np.ndarray, transform=None):
     """
-    Construct the Hermite normal form of the input matrix using only
-    * row swapping;
-    * addition of integer multiples of other rows to rows;
-    * multiplication of entire rows by -1;
+    Bring a to Hermite normal form in place (see :obj:`hermite_normal_form`).
+
+    If transform is set, apply the same row operations to it.
+
+    Raises:
+        OverflowError: if a (fixed-width integer) entry might overflow.
+            The contents of a and transform are then undefined.
 
     Returns:
-        Tuple[:obj:`np.ndarray`, :obj:`np.ndarray`, int]:
-            Tuple (r, u, rank) with r representing the Hermite normal form of input,
-            u representing the orthogonal transformation matrix such that
-            u*input=r and rank the number of nonzero rows of r which equals
-            the rank of input.
+        int: the rank of a
     """
-    a = input.copy()
     (m, n) = a.shape  # number of rows, columns
-
-    # initialize the matrix that will contain the transformation representing the sweep
-    transform = np.eye(m, dtype=int)
     col = 0  # pivot column
     row = 0  # current working row (rows with lower number are no longer involved)
     rank = m  # default: will be changed if zero-rows are detected later
@@ -92,24 +115,29 @@ def hermite_normal_form(input: np.ndarray):
         # find which row has (in this column) the smallest absolute-value entry
         smallest_abs = np.min(np.abs(a[row+nonzero_rows, col]))
         source_row = np.where(np.abs(a[row:, col]) == smallest_abs)[0][0]+row
-        to_next_col = True  # default value. will be set to false later if nonzero elements remain
-        for target_row in range(row, m):
-            if source_row == target_row:
-                continue
-            reduce_row(a, shadow=transform, pivot_col=col, source_row=source_row,
-                       target_row=target_row)
-            if a[target_row, col] != 0:
-                # at least one of the rows still has a nonzero element
-                # this happens when not all elements in this column are multiples of the smallest
-                # will need to do this column again with whichever row is now the smallest.
-                to_next_col = False
+        # reduce all other active rows with the source row at once. This is the same as
+        # calling reduce_row for each of them, because the source row does not change.
+        target_rows = row + nonzero_rows
+        target_rows = target_rows[target_rows != source_row]
+        q = a[target_rows, col] // a[source_row, col]  # integer division
+        _check_row_update(a[row:, :], q, a[source_row, :])
+        if isinstance(transform, np.ndarray):
+            _check_row_update(transform[row:, :], q, transform[source_row, :])
+        a[target_rows, :] -= q[:, np.newaxis] * a[source_row, :]
+        if isinstance(transform, np.ndarray):
+            transform[target_rows, :] -= q[:, np.newaxis] * transform[source_row, :]
+        # if at least one of the rows still has a nonzero element, this happens when not all
+        # elements in this column are multiples of the smallest. We will need to do this
+        # column again with whichever row is now the smallest.
+        to_next_col = not np.any(a[target_rows, col])
         if to_next_col:
             # all relevant elements in this column are 0 now.
             # swap source_row to the top of active block and increase row variable so it will
             # no longer be touched
             if source_row != row:
                 swaprows(a, source_row, row)
-                swaprows(transform, source_row, row)
+                if isinstance(transform, np.ndarray):
+                    swaprows(transform, source_row, row)
             # pivot element is now in "row"
             # HNF rule: pivot element must be positive
             if a[row, col] < 0:
@@ -122,4 +150,156 @@ def hermite_normal_form(input: np.ndarray):
             row += 1
             # It's tempting to also update col here
             # but then we'd have to duplicate the rank-checking code
-    return (a, transform, rank)
+    return rank
+
+
+def _narrow(a):
+    """Convert an array of Python integers back to fixed-width integers if possible."""
+    if a is not None and a.dtype == object and \
+            int(np.max(np.abs(a), initial=0)) < SAFE_BOUND:
+        return a.astype(np.int64)
+    return a
+
+
+def _hermite_normal_form_safe(input: np.ndarray, compute_transform):
+    """
+    Compute the Hermite normal form of input (and optionally the transformation matrix)
+    using fixed-width integers, falling back to Python integers on overflow.
+
+    Returns:
+        Tuple[:obj:`np.ndarray`, :obj:`np.ndarray`, int]: see :obj:`hermite_normal_form`
+    """
+    global slow_path_count
+    if input.dtype != object:
+        a = input.astype(np.int64)
+        if int(np.max(np.abs(a), initial=0)) < SAFE_BOUND:
+            transform = np.eye(a.shape[0], dtype=np.int64) if compute_transform else None
+            try:
+                rank = _hermite_normal_form_inplace(a, transform)
+                return (a, transform, rank)
+            except OverflowError:
+                pass
+        slow_path_count += 1
+    a = input.astype(object)
+    transform = np.eye(a.shape[0], dtype=np.int64).astype(object) if compute_transform else None
+    rank = _hermite_normal_form_inplace(a, transform)
+    return (_narrow(a), _narrow(transform), rank)
+
+
+def hermite_normal_form(input: np.ndarray, compute_transform=True, chunk_size=1024):
+    """
+    Construct the Hermite normal form of the input matrix using only
+    * row swapping;
+    * addition of integer multiples of other rows to rows;
+    * multiplication of entire rows by -1;
+
+    If the transformation matrix is not needed, set compute_transform to False.
+    The input rows are then processed chunk_size rows at a time, keeping only the nonzero
+    rows of the Hermite normal form of the rows seen so far (at most as many as the
+    number of columns). The memory use is then independent of the number of input rows.
+
+    The elimination uses fixed-width integers (int64) as long as the entries are guaranteed
+    to fit. If a row operation could overflow, the elimination (of the current chunk, if
+    compute_transform is False) is redone with Python integers, and the module variable
+    slow_path_count is increased by one. The result then has dtype=object if its entries
+    do not fit in int64.
+
+    Returns:
+        Tuple[:obj:`np.ndarray`, :obj:`np.ndarray`, int]:
+            Tuple (r, u, rank) with r representing the Hermite normal form of input,
+            u representing the orthogonal transformation matrix such that
+            u*input=r and rank the number of nonzero rows of r which equals
+            the rank of input.
+            If compute_transform is False, u is None and r contains only the
+            nonzero rows.
+    """
+    if not compute_transform:
+        n = input.shape[1]
+        basis = np.zeros((0, n), dtype=np.int64)
+        for start in range(0, len(input), chunk_size):
+            a = np.concatenate((basis, input[start:start + chunk_size]))
+            a, _, rank = _hermite_normal_form_safe(a, compute_transform=False)
+            basis = a[:rank]
+        return (basis, None, len(basis))
+
+    # the transformation matrix representing the sweep is initialized as identity matrix
+    return _hermite_normal_form_safe(input, compute_transform=True)
+
+
+def extend_basis(basis: np.ndarray, rows: np.ndarray):
+    """
+    Add rows to a lattice basis in Hermite normal form.
+
+    Args:
+        basis (:obj:`np.ndarray`): Matrix in Hermite normal form without zero rows
+            (at most as many rows as columns).
+        rows (:obj:`np.ndarray`): Rows to add to the lattice spanned by basis.
+
+    Returns:
+        :obj:`np.ndarray`: The Hermite normal form (without zero rows) of the lattice
+        spanned by the rows of basis and rows together.
+    """
+    stacked = np.concatenate((basis, rows))
+    r, _, _ = hermite_normal_form(stacked, compute_transform=False)
+    return r
+
+
+def integer_rank(input: np.ndarray):
+    """
+    Compute the rank of an integer matrix, which is the dimension of the lattice
+    spanned by its rows.
+
+    This is cheaper than :obj:`hermite_normal_form` when only the rank is needed.
+    Zero rows are dropped and rows are deduplicated after giving their first nonzero
+    element a positive sign. Then a fraction-free elimination is done column by column,
+    treating all remaining rows at once and dividing every row by the gcd of its elements
+    to limit coefficient growth. The elimination stops as soon as the rank equals the
+    number of columns or no rows are left. It uses fixed-width integers as long as the
+    entries are guaranteed to fit and Python integers otherwise.
+
+    Returns:
+        int: the rank of input
+    """
+    a = _narrow(np.asarray(input))
+    if a.dtype != object:
+        # the elimination accumulates products, so narrow input dtypes are widened
+        a = a.astype(np.int64)
+    a = a[np.any(a != 0, axis=1)]
+    if len(a) == 0:
+        return 0
+    (m, n) = a.shape
+    first_nonzero = a[np.arange(m), np.argmax(a != 0, axis=1)]
+    a = np.where((first_nonzero < 0)[:, np.newaxis], -a, a)
+    if a.dtype != object:  # np.unique does not support rows of Python integers
+        a = np.unique(a, axis=0)
+    rank = 0
+    for col in range(n):
+        nonzero_rows = np.nonzero(a[:, col])[0]
+        if len(nonzero_rows) == 0:
+            continue
+        # use the row with the smallest pivot to limit coefficient growth
+        pivot_row = nonzero_rows[np.argmin(np.abs(a[nonzero_rows, col]))]
+        pivot = a[pivot_row, :].copy()
+        rank += 1
+        a = np.delete(a, pivot_row, axis=0)
+        nonzero_rows = np.nonzero(a[:, col])[0]
+        if rank == n or len(a) == 0:
+            break
+        if len(nonzero_rows) == 0:
+            continue
+        rows = a[nonzero_rows, :]
+        if a.dtype != object:
+            largest = int(np.max(np.abs(rows))) * int(np.max(np.abs(pivot))) * 2
+            if largest >= SAFE_BOUND:
+                a = a.astype(object)
+                rows = rows.astype(object)
+                pivot = pivot.astype(object)
+        # eliminate column col without leaving the integers
+        rows = rows * pivot[col] - rows[:, col:col + 1] * pivot
+        divisor = np.gcd.reduce(rows, axis=1)
+        divisor[divisor == 0] = 1
+        a[nonzero_rows, :] = rows // divisor[:, np.newaxis]
+        a = a[np.any(a != 0, axis=1)]
+        if len(a) == 0:
+            break
+    return rank
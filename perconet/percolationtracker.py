@@ -0,0 +1,202 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import numpy as np
+import perconet.looptools as looptools
+
+
+class PercolationTracker:
+    """
+    Track the percolation dimension of a periodic net while edges are added one at a time.
+
+    The tracker maintains a union-find structure over the nodes in which every node stores
+    its offset: the boundary-crossing vector of a path from the root of its cluster to the node.
+    An edge within a cluster then closes a loop with vector
+    offset(node1) + boundary_vector - offset(node2), so every call to :obj:`add_edge` takes
+    near-constant amortized time. Each cluster keeps a basis of at most dim loops, and a
+    basis of all loops is kept for the network as a whole.
+
+    Because the percolation dimension cannot increase once a basis has full rank, such a
+    basis is no longer updated: it spans all directions, but it is not necessarily a basis
+    of the full lattice of loops. Use :obj:`LoopFinder.get_independent_loops` for that.
+
+    Args:
+        n (int): The number of nodes.
+        dim (int, optional): Spatial dimension. Defaults to 3.
+    """
+    def __init__(self, n: int, dim=3):
+        if n < 1:
+            raise ValueError("Number of nodes must be a positive integer.")
+        self.dimension = dim
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.offset = np.zeros((n, dim), dtype=int)
+        # loop bases of clusters, indexed by root node. only clusters with loops are stored
+        self.cluster_basis = {}
+        self.basis = np.zeros((0, dim), dtype=int)
+
+    def __find(self, node):
+        """
+        Find the root of the cluster of node, compressing the path on the way.
+
+        Returns:
+            Tuple[int, :obj:`numpy.ndarray`]: The root and the offset of node relative to it.
+        """
+        parent = self.parent
+        path = []
+        while parent[node] != node:
+            path.append(node)
+            node = parent[node]
+        root = node
+        # start at the end of the path nearest to the root, so the offset of the
+        # parent is already relative to the root
+        for node in reversed(path[:-1]):
+            self.offset[node] += self.offset[parent[node]]
+            parent[node] = root
+        if len(path) == 0:
+            return root, self.offset[root]
+        return root, self.offset[path[0]]
+
+    def __add_loops(self, root, loops):
+        """Add loops to the basis of the cluster of root and to the global basis."""
+        basis = self.cluster_basis.get(root, np.zeros((0, self.dimension), dtype=int))
+        if len(basis) < self.dimension:
+            self.cluster_basis[root] = looptools.extend_basis(basis, loops)
+        if len(self.basis) < self.dimension:
+            self.basis = looptools.extend_basis(self.basis, loops)
+
+    def add_edge(self, node1: int, node2: int, boundary_vector):
+        """
+        Add an edge and update the percolation status.
+
+        Args:
+            node1 (int): The first node of the edge.
+            node2 (int): The second node of the edge.
+            boundary_vector (:obj:`List` of int): The boundary-crossing vector of the edge
+                going from node1 to node2. See :obj:`PeriodicNetwork.add_edge`.
+
+        Returns:
+            int: The percolation dimension after adding the edge.
+        """
+        boundary_vector = np.asarray(boundary_vector, dtype=int)
+        root1, offset1 = self.__find(node1)
+        root2, offset2 = self.__find(node2)
+        if root1 == root2:
+            loop = offset1 + boundary_vector - offset2
+            if np.any(loop):
+                self.__add_loops(root1, loop[np.newaxis, :])
+            return len(self.basis)
+        # union by size: attach the smaller cluster to the root of the larger one
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+            offset1, offset2 = offset2, offset1
+            boundary_vector = -boundary_vector
+        # root2 is reached from root1 by going to node1, crossing the edge
+        # and going back from node2 to root2
+        self.offset[root2] = offset1 + boundary_vector - offset2
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+        if root2 in self.cluster_basis:
+            self.__add_loops(root1, self.cluster_basis.pop(root2))
+        return len(self.basis)
+
+    def current_percolation_rank(self, node=None):
+        """
+        Get the current percolation dimension.
+
+        Args:
+            node (int, optional): If given, return the percolation dimension of the cluster
+                that contains this node. Otherwise return that of the network as a whole,
+                which is the rank of all loops combined (as in :obj:`LoopFinder`).
+
+        Returns:
+            int: The number of independent directions in which the network (or cluster)
+            percolates.
+        """
+        if node is None:
+            return len(self.basis)
+        root, _ = self.__find(node)
+        return len(self.cluster_basis.get(root, ()))
+
+
+def bond_percolation_sweep(bonds, n=None, order=None, weights=None, realizations=1,
+                           seed=None, average=False):
+    """
+    Find the number of bonds at which a periodic net starts to percolate, when its bonds
+    are added one at a time (a Newman-Ziff style sweep).
+
+    The bonds are added in a single pass to a :obj:`PercolationTracker`, recording when the
+    percolation dimension first reaches 1, 2, ..., dim. The sweep stops as soon as the
+    dimension reaches dim. The order in which bonds are added is a random permutation,
+    unless `order` or `weights` is given.
+
+    Args:
+        bonds (:obj:`numpy.ndarray`): Integer array with shape (E, 2 + dim), with one
+            bond per row as in :obj:`PeriodicNetwork.from_edge_array`.
+        n (int, optional): The number of nodes. Defaults to the largest node index
+            in `bonds` plus 1.
+        order (:obj:`numpy.ndarray`, optional): The indices of the bonds in the order in
+            which they are to be added. Bonds that are not listed are not added.
+        weights (:obj:`numpy.ndarray`, optional): One weight per bond. Bonds are added in
+            order of increasing weight. Can not be combined with `order`.
+        realizations (int, optional): The number of random permutations to sweep.
+            Defaults to 1. Must be 1 if `order` or `weights` is given.
+        seed (optional): Seed for :obj:`numpy.random.default_rng`.
+        average (bool, optional): If true, return the average over all realizations.
+
+    Raises:
+        ValueError: If `bonds` does not have shape (E, 2 + dim), or if conflicting arguments
+            are given.
+
+    Returns:
+        :obj:`numpy.ndarray`: Array with shape (realizations, dim). Element [r, k - 1] is
+        the number of bonds that had been added when the percolation dimension first
+        reached k in realization r, or -1 if it never did. If `average` is set, an array
+        with shape (dim,) with the average over the realizations that reached each
+        dimension (nan if none did).
+    """
+    bonds = np.asarray(bonds, dtype=int)
+    if bonds.ndim != 2 or bonds.shape[1] < 3:
+        raise ValueError(f"Bond array must have shape (E, 2 + dim), got {bonds.shape}")
+    if order is not None and weights is not None:
+        raise ValueError("Give either order or weights, not both.")
+    if (order is not None or weights is not None) and realizations != 1:
+        raise ValueError("Multiple realizations require a random order: "
+                         "do not give order or weights.")
+    dim = bonds.shape[1] - 2
+    if n is None:
+        # without bonds no node is referenced, and nothing percolates
+        n = int(bonds[:, 0:2].max()) + 1 if len(bonds) > 0 else 1
+    if order is not None:
+        orders = [np.asarray(order, dtype=int)]
+    elif weights is not None:
+        orders = [np.argsort(weights, kind="stable")]
+    else:
+        rng = np.random.default_rng(seed)
+        orders = (rng.permutation(len(bonds)) for _ in range(realizations))
+    thresholds = []
+    for bond_order in orders:
+        tracker = PercolationTracker(n, dim=dim)
+        reached = -1 * np.ones(dim, dtype=int)
+        rank = 0
+        ordered_bonds = bonds[bond_order].tolist()
+        for n_added, (node1, node2, *boundary_vector) in enumerate(ordered_bonds, start=1):
+            new_rank = tracker.add_edge(node1, node2, boundary_vector)
+            if new_rank > rank:
+                reached[rank:new_rank] = n_added
+                rank = new_rank
+                if rank == dim:
+                    break
+        thresholds.append(reached)
+    thresholds = np.asarray(thresholds)
+    if average:
+        n_reached = np.count_nonzero(thresholds >= 0, axis=0)
+        total = np.sum(np.where(thresholds >= 0, thresholds, 0), axis=0)
+        return np.where(n_reached > 0, total / np.maximum(n_reached, 1), np.nan)
+    return thresholds
@@ -7,11 +7,130 @@
 # * Wouter G. Ellenbroek
 # Contributing: https://github.com/wouterel/perconet
 
+import sys
+import hashlib
+from multiprocessing import shared_memory
 import numpy as np
+import perconet.graphtools as graphtools
+from perconet.percolationtracker import PercolationTracker
+from perconet.edgetable import EdgeTable
+from perconet.trajectory import TrajectoryAnalyzer
 
 # TO DO: Make the documentation reflect that the package works for n-tori, not just 3-tori
 
 
+# supported dtypes for node and edge indices and for boundary-crossing vectors
+_INDEX_DTYPES = (np.dtype(np.int32), np.dtype(np.int64))
+_CROSSING_DTYPES = (np.dtype(np.int8), np.dtype(np.int16), np.dtype(np.int32),
+                    np.dtype(np.int64))
+
+
+def _fits(values, dtype):
+    """
+    Check that all values and their negatives can be represented by an integer dtype
+    (the reversed half-edges store negated boundary-crossing vectors).
+    """
+    return len(values) == 0 or int(np.max(np.abs(values))) <= np.iinfo(dtype).max
+
+
+def _align(position, dtype):
+    """Round a byte offset up to a multiple of the itemsize of dtype."""
+    itemsize = np.dtype(dtype).itemsize
+    return -(-position // itemsize) * itemsize
+
+
+def _read_only(result):
+    """Make the numpy arrays in a result (or in a tuple or list of results) read-only."""
+    if isinstance(result, np.ndarray):
+        result.flags.writeable = False
+    elif isinstance(result, (tuple, list)):
+        for item in result:
+            _read_only(item)
+    return result
+
+
+def _canonical_edges(node_pairs, crossing, deduplicate=True):
+    """
+    Put edges in canonical orientation and remove duplicates.
+    See :obj:`PeriodicNetwork.nodeid_to_clusterid`.
+
+    Args:
+        deduplicate (bool, optional): Defaults to True. If false, duplicate edges are kept.
+
+    Returns:
+        :obj:`numpy.ndarray`: Sorted array (dtype=int) with shape (E', 2 + dim) with one
+        row per distinct edge.
+    """
+    node_pairs = node_pairs.copy()
+    crossing = crossing.copy()
+    # canonical orientation: reverse edges that go from higher to lower cluster ID
+    # and self-loops whose first nonzero crossing element is negative
+    first_nonzero = crossing[np.arange(len(crossing)), np.argmax(crossing != 0, axis=1)]
+    flip = (node_pairs[:, 0] > node_pairs[:, 1]) | \
+        ((node_pairs[:, 0] == node_pairs[:, 1]) & (first_nonzero < 0))
+    node_pairs[flip] = node_pairs[flip, ::-1]
+    crossing[flip] = -crossing[flip]
+    edges = np.concatenate((node_pairs.astype(int), crossing.astype(int)), axis=1)
+    if not deduplicate:
+        return edges[np.lexsort(edges.T[::-1])]
+    # The main reason to collect the edge data in a 5-column numpy array is
+    # that we can now use np.unique to get rid of duplicate edges
+    return np.unique(edges, axis=0)
+
+
+def _contract_chains(edges, n, harvest_loops):
+    """
+    Contract chains of nodes with two edges in an array of canonical edges (as produced by
+    :obj:`PeriodicNetwork.nodeid_to_clusterid`), see :obj:`graphtools.contract_chains`.
+
+    If harvest_loops is set, self-loops and parallel edges are harvested after every
+    contraction, which can create new chains, until no chains are left. Otherwise a single
+    contraction is done.
+
+    Returns:
+        Tuple[:obj:`numpy.ndarray`, int, :obj:`numpy.ndarray`]: The contracted edges with
+        renumbered nodes, the number of nodes and the harvested loops.
+    """
+    dim = edges.shape[1] - 2
+    loops = [np.zeros((0, dim), dtype=int)]
+    while True:
+        node1, node2, crossing, is_removed = \
+            graphtools.contract_chains(n, edges[:, 0], edges[:, 1], edges[:, 2:])
+        if not np.any(is_removed):
+            return edges, n, np.concatenate(loops)
+        new_number = np.cumsum(~is_removed) - 1
+        n = max(int(np.count_nonzero(~is_removed)), 1)
+        edges = _canonical_edges(np.stack((new_number[node1], new_number[node2]), axis=1),
+                                 crossing)
+        if not harvest_loops:
+            return edges, n, np.concatenate(loops)
+        edges, new_loops = _harvest_loops(edges)
+        loops.append(new_loops)
+
+
+def _harvest_loops(edges):
+    """
+    Split an array of canonically oriented, deduplicated edges (as produced by
+    :obj:`PeriodicNetwork.nodeid_to_clusterid`) in edges that are needed for the graph
+    search and edges that directly give a loop vector.
+
+    Returns:
+        Tuple[:obj:`numpy.ndarray`, :obj:`numpy.ndarray`]: The remaining edges, with
+        one edge for each connected pair of distinct nodes, and the loop vectors of
+        the self-loops and parallel edges.
+    """
+    is_self_loop = edges[:, 0] == edges[:, 1]
+    self_loops = edges[is_self_loop, 2:]
+    edges = edges[~is_self_loop]
+    # edges are sorted, so parallel edges are consecutive. keep the first of each group
+    _, first, group = np.unique(edges[:, 0:2], axis=0, return_index=True, return_inverse=True)
+    group = group.reshape(-1)
+    is_parallel = np.ones(len(edges), dtype=bool)
+    is_parallel[first] = False
+    parallel_loops = edges[is_parallel, 2:] - edges[first[group[is_parallel]], 2:]
+    return edges[first], np.concatenate((self_loops, parallel_loops))
+
+
 class PeriodicNetwork:
     """Store and analyze the topology of a periodic net.
 
@@ -27,38 +146,389 @@ class PeriodicNetwork:
     information is then used by :obj:`LoopFinder` to determine the percolation
     properties.
 
+    The node-based adjacency information can be stored in two ways. The default
+    ("padded") storage allocates arrays of shape (n, max_degree), so memory scales
+    with the number of nodes times the largest degree. The "csr" storage keeps the
+    adjacency in compressed-sparse-row form (see :obj:`get_csr`), so memory scales with
+    the number of edges and no maximum degree needs to be known in advance.
+
     Args:
         n (int):
             The number of nodes of the graph.
         max_degree (int):
-            The largest number of edges coming out of any node.
+            The largest number of edges coming out of any node. May be None for
+            "csr" storage, in which case the degree of nodes is not limited.
         verbose (bool, optional):
             Print debugging information to stdout. Defaults to False.
         dim (int, optional):
             Spatial dimension. Defaults to 3.
+        storage (str, optional):
+            Either "padded" (the default) or "csr".
+        index_dtype (optional):
+            The dtype of the stored node and edge indices, np.int32 or np.int64 (the
+            default). With np.int32 the network can have at most 2**31 - 1 nodes and edges.
+        crossing_dtype (optional):
+            The dtype of the stored boundary-crossing vectors, np.int8, np.int16, np.int32
+            or np.int64 (the default). Boundary vectors whose elements do not fit are
+            rejected. Loop vectors, which are sums of boundary-crossing vectors, are always
+            computed with np.int64 (or Python integers, see :obj:`looptools`).
     """
-    def __init__(self, n: int, max_degree=6, verbose=False, dim=3):
+    def __init__(self, n: int, max_degree=6, verbose=False, dim=3, storage="padded",
+                 index_dtype=np.int64, crossing_dtype=np.int64):
         if n < 1:
             raise ValueError("Number of nodes must be a positive integer.")
+        if storage not in ("padded", "csr"):
+            raise ValueError(f"Unknown storage type {storage}. Use 'padded' or 'csr'.")
+        if max_degree is None and storage == "padded":
+            raise ValueError("Padded storage requires max_degree.")
+        index_dtype = np.dtype(index_dtype)
+        crossing_dtype = np.dtype(crossing_dtype)
+        if index_dtype not in _INDEX_DTYPES:
+            raise ValueError(f"Unsupported index dtype {index_dtype}. Use int32 or int64.")
+        if crossing_dtype not in _CROSSING_DTYPES:
+            raise ValueError(f"Unsupported crossing dtype {crossing_dtype}. "
+                             "Use int8, int16, int32 or int64.")
+        if n > np.iinfo(index_dtype).max:
+            raise ValueError(f"Number of nodes {n} does not fit index dtype {index_dtype}.")
         self.number_of_nodes = n
         self.max_degree = max_degree
         self.verbose = verbose
         self.dimension = dim
+        self.storage = storage
+        self.index_dtype = index_dtype
+        self.crossing_dtype = crossing_dtype
         # allocate arrays for per-node info
-        self.boundary_crossing = np.zeros((n, max_degree, dim), dtype=int)
-        self.neighbors = -1 * np.ones((n, max_degree), dtype=int)
-        self.edges_list = -1 * np.ones((n, max_degree), dtype=int)
-        self.neighbors_counter = np.zeros(n, dtype=int)
+        if storage == "padded":
+            self.boundary_crossing = np.zeros((n, max_degree, dim), dtype=crossing_dtype)
+            self.neighbors = -1 * np.ones((n, max_degree), dtype=index_dtype)
+            self.edges_list = -1 * np.ones((n, max_degree), dtype=index_dtype)
+        else:
+            # with csr storage, the node-based info is generated from the edge table
+            # when needed (see get_csr)
+            self.boundary_crossing = None
+            self.neighbors = None
+            self.edges_list = None
+        self._csr = None
+        # the nodes and boundary-crossing vector of every edge, see get_edge_arrays
+        self.edge_table = EdgeTable(dim, node_dtype=index_dtype, crossing_dtype=crossing_dtype)
+        self.neighbors_counter = np.zeros(n, dtype=index_dtype)
         self.n_total_edges = 0  # keeps track of the total number of edges while building edge list
-        self.simple_edges_list = []  # is this duplicate info?
-        self.simple_boundary_crossing = []
-        self.bond_is_across_boundary = []
         self.n_internal_edges = 0
         self.n_boundary_edges = 0
+        self.percolation_tracker = None
+        # set up by the first call to remove_edge, see there
+        self.trajectory_analyzer = None
+        self._shared_memory = None
+        self.shared_memory_name = None
+        # incremented by every call to add_edge or remove_edge, see cached_result
+        self.modification_count = 0
+        self._cache = {}
+
+    @classmethod
+    def from_edge_array(cls, edges, n=None, max_degree=None, verbose=False, dim=None,
+                        storage="padded", index_dtype=np.int64, crossing_dtype=np.int64):
+        """
+        Construct a periodic network from an array of edges in a single bulk operation.
+
+        This is equivalent to creating an empty :obj:`PeriodicNetwork` and calling
+        :obj:`add_edge` for every row of `edges` (in order), but the validation and
+        the filling of the node-based arrays are done with vectorized numpy operations,
+        which is much faster for large networks.
+
+        Args:
+            edges (:obj:`numpy.ndarray`):
+                Integer array with shape (E, 2 + dim). Each row describes one edge as
+                node1, node2, followed by the boundary-crossing vector (see :obj:`add_edge`).
+                This is the same layout as the bond files in the test data.
+            n (int, optional):
+                The number of nodes. Defaults to the largest node index in `edges` plus 1.
+            max_degree (int, optional):
+                The largest number of edges coming out of any node. Defaults to the
+                largest degree actually present in `edges`.
+            verbose (bool, optional):
+                Print debugging information to stdout. Defaults to False.
+            dim (int, optional):
+                Spatial dimension. Defaults to the number of columns of `edges` minus 2.
+            storage (str, optional):
+                Either "padded" (the default) or "csr". See :obj:`PeriodicNetwork`.
+            index_dtype (optional): The dtype of the stored indices.
+                See :obj:`PeriodicNetwork`.
+            crossing_dtype (optional): The dtype of the stored boundary-crossing vectors.
+                See :obj:`PeriodicNetwork`.
+
+        Raises:
+            ValueError: If `edges` has the wrong shape or contains non-integer values,
+                if any rows refer to nonexistent nodes or exceed `max_degree`,
+                or if any boundary-crossing vectors do not fit `crossing_dtype`.
+                All offending rows are listed in a single error message.
+
+        Returns:
+            :obj:`PeriodicNetwork`: The new network.
+        """
+        edges = np.asarray(edges)
+        if edges.ndim == 1 and edges.size == 0:
+            edges = edges.reshape(0, 2 + (3 if dim is None else dim))
+        if edges.ndim != 2 or edges.shape[1] < 3:
+            raise ValueError(f"Edge array must have shape (E, 2 + dim), got {edges.shape}")
+        if dim is None:
+            dim = edges.shape[1] - 2
+        elif edges.shape[1] != 2 + dim:
+            raise ValueError(f"Edge array has {edges.shape[1]} columns " +
+                             f"but {2 + dim} expected for dim = {dim}")
+        if not np.issubdtype(edges.dtype, np.integer):
+            as_int = edges.astype(int)
+            if np.any(as_int != edges):
+                raise ValueError("Edge array contains non-integer values")
+            edges = as_int
+        n_edges = len(edges)
+        node1 = edges[:, 0].astype(int)
+        node2 = edges[:, 1].astype(int)
+        crossing = edges[:, 2:].astype(int)
+        if n is None:
+            if n_edges == 0:
+                raise ValueError("Number of nodes must be given for an empty edge array.")
+            n = max(int(node1.max()), int(node2.max())) + 1
+        if n < 1:
+            raise ValueError("Number of nodes must be a positive integer.")
+
+        # validate all rows at once so the error lists every offending row
+        bad_rows = np.nonzero((node1 < 0) | (node1 >= n) | (node2 < 0) | (node2 >= n))[0]
+        if len(bad_rows) > 0:
+            raise ValueError(f"Edges refer to nodes outside range 0..{n - 1} " +
+                             f"in rows {bad_rows.tolist()}")
+        if not _fits(crossing, crossing_dtype):
+            bound = np.iinfo(crossing_dtype).max
+            bad_rows = np.nonzero(np.any(np.abs(crossing) > bound, axis=1))[0]
+            raise ValueError(f"Boundary vectors exceed range -{bound}..{bound} of " +
+                             f"crossing dtype {np.dtype(crossing_dtype)} " +
+                             f"in rows {bad_rows.tolist()}")
+        if n_edges > np.iinfo(index_dtype).max:
+            raise ValueError(f"Number of edges {n_edges} does not fit " +
+                             f"index dtype {np.dtype(index_dtype)}.")
+
+        src, dst, half_edge_ids, half_crossing, offsets = \
+            graphtools.sort_half_edges(node1, node2, crossing, n)
+        degree = np.diff(offsets)
+        slot = np.arange(len(src)) - offsets[src]
+
+        largest_degree = int(degree.max()) if n_edges > 0 else 0
+        if max_degree is None:
+            if storage == "padded":
+                max_degree = max(largest_degree, 1)
+        elif largest_degree > max_degree:
+            bad_rows = np.unique(half_edge_ids[slot >= max_degree])
+            raise ValueError(f"Edges exceed max_degree = {max_degree} in rows {bad_rows.tolist()}")
+
+        network = cls(n, max_degree, verbose=verbose, dim=dim, storage=storage,
+                      index_dtype=index_dtype, crossing_dtype=crossing_dtype)
+        if storage == "padded":
+            network.neighbors[src, slot] = dst
+            network.edges_list[src, slot] = half_edge_ids
+            network.boundary_crossing[src, slot, :] = half_crossing
+        network._csr = network.__compact_csr(offsets, dst, half_edge_ids, half_crossing)
+        network.edge_table = EdgeTable.from_arrays(np.stack((node1, node2), axis=1), crossing,
+                                                   node_dtype=index_dtype,
+                                                   crossing_dtype=crossing_dtype)
+        network.neighbors_counter[:] = degree
+
+        is_across = np.any(crossing != 0, axis=1)
+        network.n_total_edges = n_edges
+        network.n_boundary_edges = int(np.count_nonzero(is_across))
+        network.n_internal_edges = n_edges - network.n_boundary_edges
+        return network
+
+    def to_shared_memory(self, name=None):
+        """
+        Copy the edge and CSR arrays of the network to a new block of shared memory.
+
+        The returned network uses these arrays directly. Other processes can attach to the
+        same block with :obj:`from_shared_memory`, and pickling the returned network (for
+        instance to pass it to a :obj:`concurrent.futures.ProcessPoolExecutor`) only
+        transfers the name of the block, so no arrays are serialized or copied. Workers can
+        analyze the whole network or, with an `edge_mask`, separate parts of it.
+
+        A network in shared memory uses "csr" storage and can not be modified.
+        The process that created the block should call :obj:`close_shared_memory` with
+        `unlink` set once all processes are done with it.
+
+        Args:
+            name (str, optional): The name of the block. By default a unique name is chosen.
+
+        Returns:
+            :obj:`PeriodicNetwork`: The network backed by shared memory. Its
+            `shared_memory_name` attribute holds the name of the block.
+        """
+        node_pairs, crossing = self.get_edge_arrays()
+        offsets, neighbors, edges, half_crossing = self.get_csr()
+        header = np.array([self.number_of_nodes, self.dimension, self.n_total_edges,
+                           len(neighbors), -1 if self.max_degree is None else self.max_degree,
+                           self.n_boundary_edges, self.index_dtype.itemsize,
+                           self.crossing_dtype.itemsize], dtype=np.int64)
+        arrays = (header, offsets, node_pairs, neighbors, edges, self.neighbors_counter,
+                  crossing, half_crossing)
+        # every array starts at a multiple of its itemsize, so all views are aligned
+        positions = []
+        size = 0
+        for array in arrays:
+            positions.append(_align(size, array.dtype))
+            size = positions[-1] + array.nbytes
+        memory = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+        for array, position in zip(arrays, positions):
+            view = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf,
+                              offset=position)
+            view[...] = array
+        return PeriodicNetwork.__from_buffer(memory)
+
+    @classmethod
+    def from_shared_memory(cls, name: str):
+        """
+        Attach to a network in shared memory that was created with :obj:`to_shared_memory`,
+        for example in a worker process. No arrays are copied.
+
+        Args:
+            name (str): The name of the block of shared memory.
+
+        Returns:
+            :obj:`PeriodicNetwork`: The network backed by the shared memory.
+        """
+        if sys.version_info >= (3, 13):
+            # only the creator of the block should remove it
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            memory = shared_memory.SharedMemory(name=name)
+        return cls.__from_buffer(memory)
+
+    @classmethod
+    def __from_buffer(cls, memory):
+        """Construct a network whose arrays are views of a block of shared memory."""
+        header = np.ndarray((8,), dtype=np.int64, buffer=memory.buf)
+        n, dim, n_edges, n_half_edges, max_degree, n_boundary_edges, index_size, \
+            crossing_size = header.tolist()
+        index_dtype = np.dtype(f"int{8 * index_size}")
+        crossing_dtype = np.dtype(f"int{8 * crossing_size}")
+        layout = [((n + 1,), np.int64), ((n_edges, 2), index_dtype),
+                  ((n_half_edges,), index_dtype), ((n_half_edges,), index_dtype),
+                  ((n,), index_dtype), ((n_edges, dim), crossing_dtype),
+                  ((n_half_edges, dim), crossing_dtype)]
+        views = []
+        position = header.nbytes
+        for shape, dtype in layout:
+            position = _align(position, dtype)
+            view = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=position)
+            view.flags.writeable = False
+            views.append(view)
+            position += view.nbytes
+        offsets, node_pairs, neighbors, edges, neighbors_counter, crossing, half_crossing = \
+            views
+        network = cls(n, None if max_degree < 0 else max_degree, dim=dim, storage="csr",
+                      index_dtype=index_dtype, crossing_dtype=crossing_dtype)
+        network.edge_table.nodes, network.edge_table.crossing = node_pairs, crossing
+        network.edge_table.size = n_edges
+        network._csr = (offsets, neighbors, edges, half_crossing)
+        network.neighbors_counter = neighbors_counter
+        network.n_total_edges = n_edges
+        network.n_boundary_edges = n_boundary_edges
+        network.n_internal_edges = n_edges - n_boundary_edges
+        network._shared_memory = memory
+        network.shared_memory_name = memory.name
+        return network
+
+    def close_shared_memory(self, unlink=False):
+        """
+        Detach the network from its block of shared memory. The network can not be used
+        after this.
+
+        Args:
+            unlink (bool, optional): Defaults to False. If true, the block is also removed,
+                which should be done once by the process that created it.
+        """
+        if self._shared_memory is None:
+            return
+        memory = self._shared_memory
+        self._shared_memory = None
+        self.edge_table = None
+        self._csr = None
+        self._cache = {}
+        self.neighbors_counter = None
+        memory.close()
+        if unlink:
+            memory.unlink()
+
+    def __reduce_ex__(self, protocol):
+        # a network in shared memory is pickled by name, see to_shared_memory
+        if self._shared_memory is not None:
+            return (PeriodicNetwork.from_shared_memory, (self._shared_memory.name,))
+        return super().__reduce_ex__(protocol)
+
+    def __getstate__(self):
+        # cached results are not pickled
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        return state
+
+    def __modified(self):
+        """Record a modification of the network and discard the cached results."""
+        self.modification_count += 1
+        self._cache = {}
+
+    def cached_result(self, key, compute):
+        """
+        Get a result that is cached until the network is next modified.
+
+        Every call to :obj:`add_edge` or :obj:`remove_edge` increments
+        `modification_count` and discards all cached results, so repeated queries of an
+        unchanged network (such as the cluster labels of :obj:`decompose`, the reduced
+        network of :obj:`get_reduced_network` and the loops found by :obj:`LoopFinder`)
+        are only computed once. Results computed for an `edge_mask` are not cached.
+        Cached results are shared between callers, so the numpy arrays in them (also inside
+        a tuple or list) are made read-only.
+
+        Args:
+            key (tuple): Identifies the result, including any arguments it depends on.
+            compute (callable): Function without arguments that computes the result if it
+                is not in the cache.
+
+        Returns:
+            The cached or newly computed result.
+        """
+        modification_count = self.modification_count
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == modification_count:
+            return entry[1]
+        result = _read_only(compute())
+        # a result computed while the network was modified (by another thread) is not kept
+        if self.modification_count == modification_count:
+            self._cache[key] = (modification_count, result)
+        return result
 
     def get_number_of_nodes(self):
         return self.number_of_nodes
 
+    def fingerprint(self):
+        """
+        Get a hash of the content of the network.
+
+        The hash covers the number of nodes, the dimension and the edges in canonical
+        orientation and order (see :obj:`nodeid_to_clusterid`), so it does not depend on the
+        order in which the edges were added, their orientation, the storage or the dtypes.
+        Networks with the same fingerprint have the same loops. The fingerprint is cached
+        until the network is modified (see :obj:`cached_result`).
+
+        Returns:
+            str: The SHA-256 hash as a hexadecimal string.
+        """
+        return self.cached_result(("fingerprint",), self.__fingerprint)
+
+    def __fingerprint(self):
+        """Compute the hash, see :obj:`fingerprint`."""
+        node_pairs, crossing = self.get_edge_arrays()
+        edges = _canonical_edges(node_pairs, crossing, deduplicate=False)
+        digest = hashlib.sha256(b"perconet.PeriodicNetwork")
+        digest.update(np.array([self.number_of_nodes, self.dimension, len(edges)],
+                               dtype="<i8").tobytes())
+        digest.update(np.ascontiguousarray(edges, dtype="<i8").tobytes())
+        return digest.hexdigest()
+
     def get_dimension(self):
         return self.dimension
 
@@ -87,16 +557,19 @@ class PeriodicNetwork:
         Returns:
             (bool): True if succesful. False if an error occurred.
         """
+        if self._shared_memory is not None:
+            print("Error in add_edge(): a network in shared memory can not be modified")
+            return False
         if(node1 >= self.number_of_nodes):
             print(f"Error in add_edge(): node {node1} does not exist (N = {self.number_of_nodes})")
             return False
         if(node2 >= self.number_of_nodes):
             print(f"Error in add_edge(): node {node2} does not exist (N = {self.number_of_nodes})")
             return False
-        if(self.neighbors_counter[node1] == self.max_degree):
+        if self.max_degree is not None and self.neighbors_counter[node1] == self.max_degree:
             print(f"Cannot add edge: node {node1} already has {self.max_degree} edges")
             return False
-        if(self.neighbors_counter[node2] == self.max_degree):
+        if self.max_degree is not None and self.neighbors_counter[node2] == self.max_degree:
             print(f"Cannot add edge: node {node2} already has {self.max_degree} edges")
             return False
         if self.verbose:
@@ -105,40 +578,162 @@ class PeriodicNetwork:
             print(f"Incorrect boundary vector: {len(boundary_vector)} elements given " +
                   f"but {self.dimension} expected")
             return False
+        if not _fits(np.asarray(boundary_vector, dtype=int), self.crossing_dtype):
+            print(f"Boundary vector {list(boundary_vector)} does not fit " +
+                  f"crossing dtype {self.crossing_dtype}")
+            return False
+        if self.n_total_edges == np.iinfo(self.index_dtype).max:
+            print("Cannot add edge: the number of edges does not fit index dtype " +
+                  f"{self.index_dtype}")
+            return False
 
-        # Now we will add the bond data by appending to the various lists
-        # Convert to dataclass in the future to be more robust
+        # Now we will add the bond data to the edge table
         if any(boundary_vector):
             # This bond crosses the boundary
-            self.bond_is_across_boundary.append(True)
             self.n_boundary_edges += 1
         else:
             # This bond does not cross the boundary
-            self.bond_is_across_boundary.append(False)
             self.n_internal_edges += 1
-        self.simple_edges_list.append([node1, node2])
-        # this list constructor makes the next line work regardless of whether boundary_vector
-        # is passed as a Python list or numpy array.
-        self.simple_boundary_crossing.append([x for x in boundary_vector])
+        if self.trajectory_analyzer is not None:
+            self.trajectory_analyzer._add_edge(node1, node2, boundary_vector)
+        else:
+            self.edge_table.append(node1, node2, boundary_vector)
 
         # Next, add bond data to some node-based lists
-        self.neighbors[node1, self.neighbors_counter[node1]] = node2
-        self.edges_list[node1, self.neighbors_counter[node1]] = self.n_total_edges
-        self.boundary_crossing[node1, self.neighbors_counter[node1], :] = boundary_vector
+        # (for csr storage these are regenerated from the edge table when needed)
+        self._csr = None
+        if self.storage == "padded":
+            self.neighbors[node1, self.neighbors_counter[node1]] = node2
+            self.edges_list[node1, self.neighbors_counter[node1]] = self.n_total_edges
+            self.boundary_crossing[node1, self.neighbors_counter[node1], :] = boundary_vector
         self.neighbors_counter[node1] += 1
 
         if node2 != node1:
             # do the same inverting nodes
-            self.neighbors[node2, self.neighbors_counter[node2]] = node1
-            self.edges_list[node2, self.neighbors_counter[node2]] = self.n_total_edges
-            self.boundary_crossing[node2, self.neighbors_counter[node2], :] = \
-                -np.asarray(boundary_vector)  # fix this
+            if self.storage == "padded":
+                self.neighbors[node2, self.neighbors_counter[node2]] = node1
+                self.edges_list[node2, self.neighbors_counter[node2]] = self.n_total_edges
+                self.boundary_crossing[node2, self.neighbors_counter[node2], :] = \
+                    -np.asarray(boundary_vector)  # fix this
             self.neighbors_counter[node2] += 1
 
         # update n_total_edges
         self.n_total_edges += 1
+        self.__modified()
+        if self.percolation_tracker is not None:
+            self.percolation_tracker.add_edge(node1, node2, boundary_vector)
+        return True
+
+    def remove_edge(self, node1: int, node2: int, boundary_vector):
+        """
+        Remove an edge from the periodic network.
+
+        The edge may be given in either orientation: the edge from node1 to node2 with
+        boundary_vector is the same as the edge from node2 to node1 with the inverted vector.
+        If there are several identical edges, the one with the highest edge number is
+        removed. The last edge then takes over the number of the removed edge (see
+        :obj:`EdgeTable.delete`), and the node-based arrays are updated in place.
+
+        The first call attaches a :obj:`TrajectoryAnalyzer` to the network (as
+        `trajectory_analyzer`), which shares its edge table. From then on, :obj:`add_edge` and
+        this method update the internal clusters and the list of boundary-crossing edges of
+        the analyzer in place and mark the changed clusters. The loops of
+        :obj:`LoopFinder.get_independent_loops`, :obj:`LoopFinder.get_percolation_dimension`
+        and :obj:`current_percolation_rank` then only search the components of the reduced
+        network that contain a marked cluster, and :obj:`decompose` and
+        :obj:`get_reduced_network` use the clusters and boundary-crossing edges of the
+        analyzer. Only the CSR arrays (see :obj:`get_csr`) are built again from the edge
+        table when they are next needed.
+
+        Args:
+            node1 (int): The first node of the edge.
+            node2 (int): The second node of the edge.
+            boundary_vector (:obj:`List` of int): The boundary-crossing vector of the edge
+                going from node1 to node2. See :obj:`add_edge`.
+
+        Returns:
+            (bool): True if succesful. False if the edge does not exist.
+        """
+        if self._shared_memory is not None:
+            print("Error in remove_edge(): a network in shared memory can not be modified")
+            return False
+        for node in (node1, node2):
+            if not 0 <= node < self.number_of_nodes:
+                print(f"Error in remove_edge(): node {node} does not exist " +
+                      f"(N = {self.number_of_nodes})")
+                return False
+        if self.trajectory_analyzer is None:
+            self.trajectory_analyzer = TrajectoryAnalyzer._attach(self)
+        # the analyzer only checks the edges of node1
+        edge = self.trajectory_analyzer._find_edge(node1, node2, boundary_vector)
+        if edge == -1:
+            print(f"Cannot remove edge: no edge from {node1} to {node2} " +
+                  f"with boundary vector {[int(x) for x in boundary_vector]}")
+            return False
+        node1, node2 = self.edge_table.nodes[edge].tolist()
+        stored_vector = self.edge_table.crossing[edge].tolist()
+        if any(stored_vector):
+            self.n_boundary_edges -= 1
+        else:
+            self.n_internal_edges -= 1
+        moved = self.trajectory_analyzer._remove_edge(edge)
+        self._csr = None
+        for node in {node1, node2}:
+            if self.storage == "padded":
+                # close the gap in the neighbor slots of node
+                count = self.neighbors_counter[node]
+                slot = int(np.nonzero(self.edges_list[node, :count] == edge)[0][0])
+                for array in (self.neighbors, self.edges_list, self.boundary_crossing):
+                    array[node, slot:count - 1] = array[node, slot + 1:count]
+                self.neighbors[node, count - 1] = -1
+                self.edges_list[node, count - 1] = -1
+                self.boundary_crossing[node, count - 1, :] = 0
+            self.neighbors_counter[node] -= 1
+        if self.storage == "padded" and moved != -1:
+            # renumber the moved edge, keeping the slots of its nodes in edge order
+            for node in set(self.edge_table.nodes[edge].tolist()):
+                count = self.neighbors_counter[node]
+                row = self.edges_list[node, :count]
+                row[row == moved] = edge
+                order = np.argsort(row, kind="stable")
+                for array in (self.neighbors, self.edges_list, self.boundary_crossing):
+                    array[node, :count] = array[node, order]
+        self.n_total_edges -= 1
+        self.__modified()
+        # the percolation tracker cannot undo an edge. the analyzer takes over
+        self.percolation_tracker = None
         return True
 
+    def current_percolation_rank(self, node=None):
+        """
+        Get the number of independent directions in which the network percolates.
+
+        The first call sets up a :obj:`PercolationTracker` with all edges added so far.
+        After that, every call to :obj:`add_edge` updates the tracker in near-constant
+        amortized time, so this method can be used to monitor the percolation status
+        while a network is being built. Once an edge has been removed, the tracker is
+        replaced by the :obj:`TrajectoryAnalyzer` of the network (see :obj:`remove_edge`).
+
+        Args:
+            node (int, optional): If given, return the percolation dimension of the
+                cluster that contains this node (using all bonds, including those that
+                cross a boundary).
+
+        Returns:
+            int: The percolation dimension of the network (or of the cluster of node).
+            For the network as a whole this equals the number of loops returned by
+            :obj:`LoopFinder.get_independent_loops`.
+        """
+        if self.trajectory_analyzer is not None:
+            return self.trajectory_analyzer.current_percolation_rank(node)
+        if self.percolation_tracker is None:
+            tracker = PercolationTracker(self.number_of_nodes, dim=self.dimension)
+            node_pairs, crossing = self.get_edge_arrays()
+            for node1, node2, *boundary_vector in np.hstack((node_pairs, crossing)).tolist():
+                tracker.add_edge(node1, node2, boundary_vector)
+            self.percolation_tracker = tracker
+        return self.percolation_tracker.current_percolation_rank(node)
+
     def get_number_of_neighbors(self, node):
         """
         Get the number of bonds of node.
@@ -150,7 +745,76 @@ class PeriodicNetwork:
             int: The number of edges (bonds) involving this node
         """
 
-        return np.count_nonzero(self.neighbors[node, :] != -1)
+        return self.neighbors_counter[node]
+
+    def get_csr(self):
+        """
+        Get the adjacency information of the network in compressed-sparse-row (CSR) form.
+
+        The neighbors of node i are `neighbors[offsets[i]:offsets[i+1]]`, in the same order
+        as in :obj:`get_neighbors`, and the corresponding edge numbers and boundary-crossing
+        vectors (pointing away from node i) are stored at the same positions of `edges`
+        and `crossing`. The arrays are cached until the next call to :obj:`add_edge`
+        and should not be modified.
+
+        Returns:
+            Tuple of :obj:`numpy.ndarray`: (offsets, neighbors, edges, crossing) with shapes
+            (n + 1,), (H,), (H,), (H, dim), where H is the number of half-edges (twice the
+            number of edges, minus the number of self-bonds).
+        """
+        if self._csr is None:
+            node_pairs, crossing = self.get_edge_arrays()
+            _, dst, edge_ids, half_crossing, offsets = \
+                graphtools.sort_half_edges(node_pairs[:, 0], node_pairs[:, 1], crossing,
+                                           self.number_of_nodes)
+            self._csr = self.__compact_csr(offsets, dst, edge_ids, half_crossing)
+        return self._csr
+
+    def __compact_csr(self, offsets, neighbors, edges, crossing):
+        """Convert CSR arrays to the dtypes of the network (offsets remain int64)."""
+        return (offsets, neighbors.astype(self.index_dtype, copy=False),
+                edges.astype(self.index_dtype, copy=False),
+                crossing.astype(self.crossing_dtype, copy=False))
+
+    def get_edge_arrays(self):
+        """
+        Get the edges of the network as arrays.
+
+        The arrays are views of the :obj:`EdgeTable` of the network. They are valid until
+        the next call to :obj:`add_edge` or :obj:`remove_edge` and should not be modified.
+
+        Returns:
+            Tuple[:obj:`numpy.ndarray`, :obj:`numpy.ndarray`]: (node_pairs, crossing) with
+            shapes (E, 2) and (E, dim), containing the two nodes and the boundary-crossing
+            vector of each edge, indexed by edge number.
+        """
+        return self.edge_table.get_node_pairs(), self.edge_table.get_crossing()
+
+    @property
+    def simple_edges_list(self):
+        """:obj:`List` of [node1, node2] for every edge, indexed by edge number."""
+        return self.edge_table.get_node_pairs().tolist()
+
+    @property
+    def simple_boundary_crossing(self):
+        """:obj:`List` of the boundary-crossing vector of every edge, indexed by edge number."""
+        return self.edge_table.get_crossing().tolist()
+
+    @property
+    def bond_is_across_boundary(self):
+        """:obj:`List` of bool that is True for every edge that crosses a boundary."""
+        return np.any(self.edge_table.get_crossing() != 0, axis=1).tolist()
+
+    def __pad(self, values):
+        """Pad a 1d array of per-neighbor values with -1 to the maximum degree."""
+        width = self.max_degree
+        if width is None:
+            # the largest degree, cached like the CSR arrays until the network is modified
+            width = self.cached_result(("pad_width",),
+                                       lambda: max(int(np.max(self.neighbors_counter)), 1))
+        padded = -1 * np.ones(width, dtype=int)
+        padded[:len(values)] = values
+        return padded
 
     def get_neighbors(self, node, padded=True):
         """
@@ -160,11 +824,17 @@ class PeriodicNetwork:
             node (int): node number
             padded (bool, optional): If true (the default), the list will be padded
                 with values -1 to the value of maximum_neighbors_per_node passed to
-                the constructor. Otherwise the length will be the number of neighbors of i.
+                the constructor (or to the largest degree in the network for "csr"
+                storage without max_degree).
+                Otherwise the length will be the number of neighbors of i.
 
         Returns:
             :obj:`numpy.ndarray`: Numpy array (dtype=int) containing list of neighbors of node.
         """
+        if self.storage == "csr":
+            offsets, neighbors, _, _ = self.get_csr()
+            neighbors_of_node = neighbors[offsets[node]:offsets[node + 1]]
+            return self.__pad(neighbors_of_node) if padded else neighbors_of_node
         neighbors_of_node = self.neighbors[node, :]
         if padded:
             return neighbors_of_node
@@ -186,6 +856,11 @@ class PeriodicNetwork:
                 A return value of -1 indicates that the edge does not exist.
 
         """
+        if self.storage == "csr":
+            if nb_index >= self.neighbors_counter[node]:
+                return -1
+            offsets, neighbors, _, _ = self.get_csr()
+            return neighbors[offsets[node] + nb_index]
         return self.neighbors[node, nb_index]
 
     def get_edges(self, node, padded=True):
@@ -196,13 +871,19 @@ class PeriodicNetwork:
             node (int): The index of the node for which to return the edge list
             padded (bool, optional): If true (the default), the list will be padded
                 with values -1 to the value of maximum_neighbors_per_node passed to
-                the constructor. Otherwise the length will be the number of neighbors of node.
+                the constructor (or to the largest degree in the network for "csr"
+                storage without max_degree).
+                Otherwise the length will be the number of neighbors of node.
 
         Returns:
             :obj:`numpy.ndarray`:
             Numpy array (dtype=int) containing the edge numbers of all edges involving node.
 
         """
+        if self.storage == "csr":
+            offsets, _, edges, _ = self.get_csr()
+            edges_of_node = edges[offsets[node]:offsets[node + 1]]
+            return self.__pad(edges_of_node) if padded else edges_of_node
         edges_of_node = self.edges_list[node, :]
         if padded:
             return edges_of_node
@@ -231,6 +912,11 @@ class PeriodicNetwork:
                 A return value of -1 indicates that the edge does not exist.
 
         """
+        if self.storage == "csr":
+            if nb_index >= self.neighbors_counter[node]:
+                return -1
+            offsets, _, edges, _ = self.get_csr()
+            return edges[offsets[node] + nb_index]
         return self.edges_list[node, nb_index]
 
     def get_boundary_crossing(self, node, nb_index):
@@ -247,6 +933,11 @@ class PeriodicNetwork:
             a numpy array with length equal to the dimensionality of the network
             and dtype=int.
         """
+        if self.storage == "csr":
+            if nb_index >= self.neighbors_counter[node]:
+                return np.zeros(self.dimension, dtype=int)
+            offsets, _, _, crossing = self.get_csr()
+            return crossing[offsets[node] + nb_index, :]
         return self.boundary_crossing[node, nb_index, :]
 
     def crosses_boundaries(self):
@@ -270,7 +961,32 @@ class PeriodicNetwork:
         """
         return (self.n_internal_edges > 0)
 
-    def __label_component(self, start,  current_label, labels, internal_only=True):
+    def check_edge_mask(self, edge_mask):
+        """
+        Validate a boolean edge mask that selects a subnetwork.
+
+        Methods that accept an `edge_mask` (:obj:`decompose`, :obj:`nodeid_to_clusterid`,
+        :obj:`get_reduced_network` and :obj:`LoopFinder`) treat the network as if only the
+        edges i with edge_mask[i] set were present. The mask is applied to the existing edge
+        and CSR arrays, so no copy of the network is made.
+
+        Args:
+            edge_mask (:obj:`numpy.ndarray`): Boolean array with one element per edge,
+                in the order in which the edges were added. None selects all edges.
+
+        Returns:
+            :obj:`numpy.ndarray`: The mask as a boolean array, or None.
+        """
+        if edge_mask is None:
+            return None
+        edge_mask = np.asarray(edge_mask)
+        if edge_mask.dtype != bool or edge_mask.shape != (self.n_total_edges,):
+            raise ValueError("Edge mask must be a boolean array with shape "
+                             f"({self.n_total_edges},).")
+        return edge_mask
+
+    def __label_component(self, start,  current_label, labels, is_across, internal_only=True,
+                          edge_mask=None):
         """
         Label the entire connected component to which node start belongs with label current_label.
 
@@ -279,17 +995,22 @@ class PeriodicNetwork:
             current_label (int): the label for this connected component
             labels (:obj:`numpy.ndarray`): numpy array (dtype=int) containing the label
                 of each node/vertex. This array is updated by this recursive routine.
+            is_across (:obj:`numpy.ndarray`): boolean array that is True for the edges
+                that cross a boundary
         """
         labels[start] = current_label
-        # assert len(self.neighbors[1]) == self.max_degree  # using this to simplify next line
-        for index in range(self.max_degree):
-            neigh = self.neighbors[start, index]
-            if neigh != -1 and labels[neigh] == -1:
-                if not (internal_only and
-                        self.bond_is_across_boundary[self.edges_list[start, index]]):
-                    self.__label_component(neigh, current_label, labels)
+        offsets, neighbors, edges, _ = self.get_csr()
+        for index in range(offsets[start], offsets[start + 1]):
+            neigh = neighbors[index]
+            if labels[neigh] == -1:
+                if internal_only and is_across[edges[index]]:
+                    continue
+                if edge_mask is not None and not edge_mask[edges[index]]:
+                    continue
+                self.__label_component(neigh, current_label, labels, is_across,
+                                       internal_only=internal_only, edge_mask=edge_mask)
 
-    def decompose(self, internal_only=True):
+    def decompose(self, internal_only=True, method="auto", edge_mask=None):
         """
         Obtain the cluster decomposition of the network. This method is used
         by :obj:`LoopFinder` (using internal bonds only) to reduce the network for faster
@@ -299,11 +1020,44 @@ class PeriodicNetwork:
             internal_only (bool, optional): Defaults to True.
                 If true, use only bonds that do not cross
                 any boundary for the cluster decomposition.
+            method (str, optional): The algorithm used to find the clusters.
+                "unionfind" uses a vectorized union-find over the edge arrays,
+                "scipy" uses :obj:`scipy.sparse.csgraph.connected_components` (requires SciPy),
+                "recursive" uses a recursive search from each node, which is limited
+                by the Python recursion limit for large clusters.
+                The default "auto" uses "scipy" if SciPy is installed and "unionfind" otherwise.
+                All methods give identical labels. Once an edge has been removed, the
+                internal clusters kept by the network are used instead (see
+                :obj:`remove_edge`).
+            edge_mask (:obj:`numpy.ndarray`, optional): Use only the edges selected by this
+                boolean mask. See :obj:`check_edge_mask`.
 
         Returns:
             Tuple[:obj:`List` of int, int]: A list with the cluster ID of each node
-            and the number of clusters
+            and the number of clusters. Without `edge_mask`, the result is cached until the
+            network is modified (see :obj:`cached_result`).
         """
+        edge_mask = self.check_edge_mask(edge_mask)
+        if edge_mask is None:
+            return self.cached_result(("decompose", internal_only, method),
+                                      lambda: self.__decompose(internal_only, method, None))
+        return self.__decompose(internal_only, method, edge_mask)
+
+    def __decompose(self, internal_only, method, edge_mask):
+        """Find the cluster decomposition, see :obj:`decompose`."""
+        if internal_only and edge_mask is None and self.trajectory_analyzer is not None:
+            # the analyzer keeps the clusters up to date, see remove_edge
+            return self.trajectory_analyzer._cluster_labels()
+        if method != "recursive":
+            node_pairs, crossing = self.get_edge_arrays()
+            selected = np.ones(len(node_pairs), dtype=bool) if edge_mask is None else edge_mask
+            if internal_only:
+                selected = selected & ~np.any(crossing != 0, axis=1)
+            node_pairs = node_pairs[selected]
+            return graphtools.component_labels(self.number_of_nodes, node_pairs[:, 0],
+                                               node_pairs[:, 1], method=method)
+        _, crossing = self.get_edge_arrays()
+        is_across = np.any(crossing != 0, axis=1)
         # initiate with first cluster label
         current_label = 0
         # initialise list of labels (-1 == unlabeled)
@@ -311,69 +1065,175 @@ class PeriodicNetwork:
         for node in range(self.number_of_nodes):
             if labels[node] == -1:
                 # this node is still unlabeled. Start recursion to label its connected component.
-                self.__label_component(node, current_label, labels, internal_only=internal_only)
+                self.__label_component(node, current_label, labels, is_across,
+                                       internal_only=internal_only, edge_mask=edge_mask)
                 current_label += 1
         n_labels = np.amax(labels) + 1
         # At this point, all elements of labels are >=0 and < n_labels
         # assert np.amin(labels) == 0
         return labels, n_labels
 
-    def nodeid_to_clusterid(self, clusterlabels):
+    def nodeid_to_clusterid(self, clusterlabels, edge_mask=None):
+        """
+        Relabel the endpoints of all boundary-crossing edges with the cluster ID of their nodes.
+
+        Args:
+            clusterlabels (:obj:`numpy.ndarray`): The cluster ID of each node,
+                as returned by :obj:`decompose`.
+            edge_mask (:obj:`numpy.ndarray`, optional): Use only the edges selected by this
+                boolean mask. See :obj:`check_edge_mask`.
+
+        Every reduced edge is stored in canonical orientation: the first cluster ID is not
+        larger than the second one and, for edges that connect a cluster to itself, the first
+        nonzero element of the boundary-crossing vector is positive. This way an edge and its
+        reverse are recognized as duplicates.
+
+        Returns:
+            :obj:`numpy.ndarray`: Array (dtype=int) with shape (E', 2 + dim) with one
+            row per distinct reduced edge: the two cluster IDs followed by the
+            boundary-crossing vector.
+        """
+        node_pairs, crossing = self.get_edge_arrays()
         if self.verbose:
-            print(self.simple_edges_list, self.simple_boundary_crossing)
-        reduced_network = []
-        for edge, newnodes in enumerate(self.simple_edges_list):
-            if self.bond_is_across_boundary[edge]:
-                connected_labels = clusterlabels[newnodes].tolist()
-                # parameters are now in two python lists which we can concatenate
-                # using the addition operator
-                edgedata = connected_labels + self.simple_boundary_crossing[edge]
-                reduced_network.append(edgedata)
-        reduced_network = np.asarray(reduced_network, dtype=int)
-        # The main reason to collect the edge data in a 5-column numpy array is
-        # that we can now use np.unique to get rid of duplicate edges
-        reduced_network = np.unique(reduced_network, axis=0)
-        return reduced_network
+            print(node_pairs, crossing)
+        edge_mask = self.check_edge_mask(edge_mask)
+        if edge_mask is None and self.trajectory_analyzer is not None:
+            # the analyzer keeps a list of the boundary-crossing edges, see remove_edge
+            across = self.trajectory_analyzer._boundary_edges()
+        else:
+            across = np.any(crossing != 0, axis=1)
+            if edge_mask is not None:
+                across &= edge_mask
+        labels = np.asarray(clusterlabels)[node_pairs[across]]
+        return _canonical_edges(labels, crossing[across])
 
     # methods that reduce network
-    def get_reduced_network(self):
+    def get_reduced_network(self, harvest_loops=False, edge_mask=None, contract_chains=False):
         """
         Generate the reduced network with identical boundary crossing properties
         but no internal edges.
 
+        Args:
+            harvest_loops (bool, optional): Defaults to False. If true, reduced edges that
+                are loops by themselves are removed from the reduced network and returned
+                as loop vectors instead. These are edges that connect a cluster to itself
+                (their boundary-crossing vector is a loop) and all but one of each set of
+                parallel edges between the same two clusters (the difference of their
+                boundary-crossing vectors with that of the remaining edge is a loop). The
+                remaining network together with the harvested loops has the same loops as
+                the full reduced network.
+            edge_mask (:obj:`numpy.ndarray`, optional): Reduce the subnetwork of the edges
+                selected by this boolean mask. See :obj:`check_edge_mask`. The edge arrays of
+                this network are shared, only the (smaller) reduced network is constructed.
+            contract_chains (bool, optional): Defaults to False. If true, chains of reduced
+                nodes with two edges each are contracted into a single edge with the summed
+                boundary-crossing vector (see :obj:`graphtools.contract_chains`). This does
+                not change the loops. With `harvest_loops`, a closed ring of such nodes is
+                harvested as a loop; otherwise it is replaced by one node with a self-loop.
+
         Returns:
-            :obj:`PeriodicNetwork`: The reduced network
+            :obj:`PeriodicNetwork`: The reduced network, with "csr" storage (unless the network
+            is returned unchanged). If `harvest_loops` is set, a tuple
+            with the reduced network and an array (dtype=int) with shape (L, dim) containing
+            the harvested loops. Without `edge_mask`, the result is cached until the network
+            is modified (see :obj:`cached_result`).
         """
-        if self.n_internal_edges == 0:
+        edge_mask = self.check_edge_mask(edge_mask)
+        if edge_mask is None:
+            return self.cached_result(
+                ("reduced_network", harvest_loops, contract_chains),
+                lambda: self.__reduce_network(harvest_loops, None, contract_chains))
+        return self.__reduce_network(harvest_loops, edge_mask, contract_chains)
+
+    def __reduce_network(self, harvest_loops, edge_mask, contract_chains):
+        """Construct the reduced network, see :obj:`get_reduced_network`."""
+        if self.n_internal_edges == 0 and not harvest_loops and edge_mask is None \
+                and not contract_chains:
             # The network has no edges that do not cross the boundary.
             # Therefore the result of reducing would be identical to the current network.
             # Returning original network.
             return self
 
         # First find a cluster decomposition of the network excluding the boundary-crossing edges
-        clusterlabels, n_labels = self.decompose()
+        clusterlabels, n_labels = self.decompose(edge_mask=edge_mask)
         if self.verbose:
             print("labels:", clusterlabels, n_labels)
 
         # each cluster in this decomposition becomes a node in the reduced network
         # the boundary crossing edges will be put back in, now with cluster IDs
         # rather than node IDs to indicate what they connect
-        reduced_network_list = self.nodeid_to_clusterid(clusterlabels)
+        reduced_network_list = self.nodeid_to_clusterid(clusterlabels, edge_mask=edge_mask)
         if self.verbose:
             print("reduced network list:", reduced_network_list)
-        if len(reduced_network_list) == 0:
-            # return network without any bonds, but with the proper number of nodes
-            return PeriodicNetwork(n_labels, 1)
-        # next line finds the number of occurrences of the most-occuring number in the
-        # first two columns of reduced_network_list
-        largest_functionality = np.max(np.unique(reduced_network_list[:, 0:2],
-                                                 return_counts=True)[1])
-        # construct new PeriodicNetwork object with n_labels nodes
-        reduced_network = PeriodicNetwork(n_labels, largest_functionality,
-                                          verbose=self.verbose, dim=self.dimension)
-        # add the edges of the reduced network
-        for edge_info in reduced_network_list:
+        if harvest_loops:
+            reduced_network_list, loops = _harvest_loops(reduced_network_list)
             if self.verbose:
-                print(edge_info)
-            reduced_network.add_edge(edge_info[0], edge_info[1], edge_info[2:])
+                print("harvested loops:", loops)
+        if contract_chains:
+            n_nodes = n_labels
+            reduced_network_list, n_labels, chain_loops = \
+                _contract_chains(reduced_network_list, n_labels, harvest_loops)
+            if self.verbose:
+                print(f"contracted chains: {n_nodes} to {n_labels} nodes")
+            if harvest_loops:
+                loops = np.concatenate((loops, chain_loops))
+        # construct new PeriodicNetwork object with n_labels nodes and all reduced edges.
+        # csr storage: a few clusters can have a very large degree, and padded arrays
+        # would be sized by that degree for every cluster
+        # contracted chains have summed boundary-crossing vectors, which may need a wider dtype
+        crossing_dtype = self.crossing_dtype
+        if not _fits(reduced_network_list[:, 2:], crossing_dtype):
+            crossing_dtype = np.int64
+        reduced_network = PeriodicNetwork.from_edge_array(reduced_network_list, n=n_labels,
+                                                          verbose=self.verbose,
+                                                          dim=self.dimension,
+                                                          storage="csr",
+                                                          index_dtype=self.index_dtype,
+                                                          crossing_dtype=crossing_dtype)
+        if harvest_loops:
+            return reduced_network, loops
         return reduced_network
+
+    def get_core_network(self):
+        """
+        Generate the 2-edge-connected core of the network: the network without the edges
+        that are not part of any cycle (bridges), and without the nodes that are left without
+        edges. Such edges can not contribute to any loop, so the core has the same loops as
+        the full network.
+
+        Dangling trees are first removed by repeatedly stripping nodes with a single edge
+        (see :obj:`graphtools.peel_leaves`). The remaining bridges, which connect separate
+        cyclic parts of the network, are then found with :obj:`graphtools.find_bridges`.
+
+        Returns:
+            Tuple[:obj:`PeriodicNetwork`, dict]: The core network (with "csr" storage), with
+            its nodes numbered in the same order as in this network, and a dict with the
+            number of pruned "leaf_edges" (edges of dangling trees), "bridges" (other bridges)
+            and "nodes".
+            The result is cached until the network is modified (see :obj:`cached_result`).
+        """
+        return self.cached_result(("core_network",), self.__prune)
+
+    def __prune(self):
+        """Construct the 2-edge-connected core, see :obj:`get_core_network`."""
+        node_pairs, crossing = self.get_edge_arrays()
+        keep = graphtools.peel_leaves(self.number_of_nodes, node_pairs[:, 0], node_pairs[:, 1])
+        n_leaf_edges = len(keep) - int(np.count_nonzero(keep))
+        remaining = np.nonzero(keep)[0]
+        is_bridge = graphtools.find_bridges(self.number_of_nodes, node_pairs[remaining, 0],
+                                            node_pairs[remaining, 1])
+        keep[remaining[is_bridge]] = False
+        node_pairs = node_pairs[keep]
+        # renumber the nodes that still have edges
+        nodes, node_pairs = np.unique(node_pairs, return_inverse=True)
+        core_network = PeriodicNetwork.from_edge_array(
+            np.concatenate((node_pairs.reshape(-1, 2), crossing[keep]), axis=1),
+            n=max(len(nodes), 1), verbose=self.verbose, dim=self.dimension,
+            storage="csr", index_dtype=self.index_dtype,
+            crossing_dtype=self.crossing_dtype)
+        pruned = {"leaf_edges": n_leaf_edges,
+                  "bridges": int(np.count_nonzero(is_bridge)),
+                  "nodes": self.number_of_nodes - len(nodes)}
+        if self.verbose:
+            print("pruned:", pruned)
+        return core_network, pruned
@@ -0,0 +1,185 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import os
+import time
+import tempfile
+import zipfile
+import numpy as np
+from perconet.periodicnetwork import PeriodicNetwork
+from perconet.loopfinder import LoopFinder
+
+# temporary files older than this (in seconds) were left behind by a process that was
+# killed while writing, and are removed by ResultCache.evict
+STALE_TEMPORARY_AGE = 3600
+
+
+class ResultCache:
+    """
+    Store the results of the analysis of networks in a directory, so networks that have
+    been analyzed before (for instance by an earlier run over the same bond files) only
+    need to be hashed.
+
+    Results are stored per network in a file named after its
+    :obj:`PeriodicNetwork.fingerprint`, containing the edges of the reduced network and
+    the independent loops. The files can be shared by several processes at the same time.
+    When the files take up more than `max_bytes`, the least recently used ones are removed
+    until they take up at most 90% of it, so the directory only needs to be scanned once
+    in a while. The total size is tracked per :obj:`ResultCache` object, so with several
+    processes the cache can temporarily grow beyond `max_bytes`. Temporary files that were
+    left behind by a killed process are removed when the directory is scanned.
+    Loops that do not fit in 64-bit integers are not stored.
+
+    Args:
+        directory (str): The directory for the cached results. It is created if needed.
+        max_bytes (int, optional): The maximum total size of the cached results.
+            Defaults to 1 GiB.
+    """
+    def __init__(self, directory, max_bytes=2**30):
+        if max_bytes < 0:
+            raise ValueError("Maximum cache size must not be negative.")
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        # the total size of the cached results, as far as known to this object.
+        # None until the directory is first scanned
+        self.total_bytes = None
+
+    def __path(self, network):
+        return os.path.join(self.directory, network.fingerprint() + ".npz")
+
+    def __load(self, network):
+        """Load the cached results of network, or return None if there are none."""
+        path = self.__path(network)
+        try:
+            # np.load does not close a file it opened itself if the file is corrupt
+            with open(path, "rb") as handle, np.load(handle) as data:
+                entry = {key: data[key] for key in data.files}
+            # mark the entry as recently used
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # missing, removed meanwhile, incomplete or corrupt
+            return None
+        return entry
+
+    def __store(self, network, reduced_network, loops, n_loops):
+        """Write the results of network to its file and evict old entries if needed."""
+        loops = np.asarray(loops).reshape(-1, network.get_dimension())
+        if loops.dtype == object:
+            return
+        node_pairs, crossing = reduced_network.get_edge_arrays()
+        handle, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as output:
+                np.savez(output,
+                         reduced_edges=np.concatenate((node_pairs, crossing), axis=1),
+                         reduced_nodes=reduced_network.get_number_of_nodes(),
+                         loops=loops.astype(np.int64), n_loops=n_loops)
+            size = os.path.getsize(temporary)
+            # other processes see either no file or the complete file
+            os.replace(temporary, self.__path(network))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        if self.total_bytes is None:
+            self.evict(self.max_bytes)
+        else:
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self, target_bytes=None):
+        """
+        Remove the least recently used results until the cache takes up at most
+        `target_bytes`, if it takes up more than `max_bytes`. Temporary files that are
+        older than :obj:`STALE_TEMPORARY_AGE` are always removed.
+
+        Args:
+            target_bytes (int, optional): Defaults to 90% of `max_bytes`.
+        """
+        if target_bytes is None:
+            target_bytes = int(0.9 * self.max_bytes)
+        entries = []
+        stale = time.time() - STALE_TEMPORARY_AGE
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith((".npz", ".tmp")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith(".npz"):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif stat.st_mtime < stale:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= target_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        self.total_bytes = total
+
+    def get_reduced_network(self, network):
+        """
+        Get the reduced network (see :obj:`PeriodicNetwork.get_reduced_network`) from the
+        cache, or compute it and store it along with the independent loops.
+
+        Args:
+            network (:obj:`perconet.PeriodicNetwork`): The network to reduce.
+
+        Returns:
+            :obj:`PeriodicNetwork`: The reduced network.
+        """
+        entry = self.__load(network)
+        if entry is None:
+            self.__analyze(network)
+            return network.get_reduced_network()
+        edges = entry["reduced_edges"]
+        crossing_dtype = network.crossing_dtype
+        if np.max(np.abs(edges[:, 2:]), initial=0) > np.iinfo(crossing_dtype).max:
+            # contracted chains may need a wider dtype, as in get_reduced_network
+            crossing_dtype = np.int64
+        return PeriodicNetwork.from_edge_array(edges, n=int(entry["reduced_nodes"]),
+                                               dim=network.get_dimension(),
+                                               storage="csr",
+                                               index_dtype=network.index_dtype,
+                                               crossing_dtype=crossing_dtype)
+
+    def get_independent_loops(self, network, engine="tree"):
+        """
+        Get the independent loops (see :obj:`LoopFinder.get_independent_loops`) from the
+        cache, or compute them and store them along with the reduced network.
+
+        Args:
+            network (:obj:`perconet.PeriodicNetwork`): The network to analyze.
+            engine (str, optional): The search engine of the :obj:`LoopFinder` that is used
+                if the loops are not in the cache.
+
+        Returns:
+            Tuple[:obj:`numpy.ndarray`, int]: The independent loops and their number.
+        """
+        entry = self.__load(network)
+        if entry is None:
+            return self.__analyze(network, engine)
+        return entry["loops"], int(entry["n_loops"])
+
+    def __analyze(self, network, engine="tree"):
+        """Find and store the results of network."""
+        loops, n_loops = LoopFinder(network, verbose=False, engine=engine).get_independent_loops()
+        self.__store(network, network.get_reduced_network(), loops, n_loops)
+        return loops, n_loops
@@ -0,0 +1,511 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import threading
+import numpy as np
+import perconet.graphtools as graphtools
+import perconet.looptools as looptools
+from perconet.edgetable import EdgeTable
+
+# a cluster with at most this many nodes that is joined to a larger one is relabeled by
+# a search over its edges. the nodes of a larger cluster are found with a scan of the labels
+_SEARCH_LIMIT = 256
+
+
+def _grow(array, size, fill):
+    """Return array, or a copy padded with fill to at least size and at least twice as long."""
+    if len(array) >= size:
+        return array
+    grown = np.full((max(2 * len(array), size),) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _component_bases(n, node1, node2, crossing, component):
+    """
+    Find the independent loops of connected components of a graph.
+
+    The loops are found as in the "tree" engine of :obj:`LoopFinder`: every edge that is not
+    part of a spanning forest closes a loop with vector
+    potential(node1) + crossing - potential(node2).
+
+    Args:
+        n (int): The number of nodes.
+        node1, node2, crossing (:obj:`numpy.ndarray`): The edges. Only the components that
+            contain these edges are searched.
+        component (:obj:`numpy.ndarray`): The component label of every node, numbered as by
+            :obj:`graphtools.component_labels`.
+
+    Returns:
+        dict: The loops in Hermite normal form (without zero rows) of every component that
+        has any, indexed by component label.
+    """
+    _, neighbors, edge_ids, half_crossing, offsets = \
+        graphtools.sort_half_edges(node1, node2, crossing, n)
+    _, roots = np.unique(component, return_index=True)
+    potential, parent_index = graphtools.spanning_forest(offsets, neighbors, half_crossing,
+                                                         roots)
+    closes_loop = np.ones(len(node1), dtype=bool)
+    closes_loop[edge_ids[parent_index[parent_index >= 0]]] = False
+    node1 = node1[closes_loop]
+    node2 = node2[closes_loop]
+    loops = potential[node1] + crossing[closes_loop] - potential[node2]
+    nonzero = np.any(loops != 0, axis=1)
+    if not np.any(nonzero):
+        return {}
+    loops = loops[nonzero]
+    # the lattice does not depend on the sign and multiplicity of the loops, and many
+    # loops are the same (e.g. once around a single boundary)
+    first_nonzero = loops[np.arange(len(loops)), np.argmax(loops != 0, axis=1)]
+    loops = np.where((first_nonzero < 0)[:, np.newaxis], -loops, loops)
+    rows = np.concatenate((component[node1[nonzero]][:, np.newaxis], loops), axis=1)
+    # np.unique on rows is slow. if possible, number the rows in lexicographic order instead
+    shifted = rows - rows.min(axis=0)
+    radix = shifted.max(axis=0) + 1
+    if np.prod(radix.astype(float)) < 2**62:
+        weights = np.ones(len(radix), dtype=np.int64)
+        weights[:-1] = np.cumprod(radix[::-1])[-2::-1]
+        _, first = np.unique(shifted @ weights, return_index=True)
+        rows = rows[first]
+    else:
+        rows = np.unique(rows, axis=0)
+    labels, starts = np.unique(rows[:, 0], return_index=True)
+    bases = {}
+    for label, group in zip(labels.tolist(), np.split(rows[:, 1:], starts[1:])):
+        bases[label], _, _ = looptools.hermite_normal_form(group, compute_transform=False)
+    return bases
+
+
+class TrajectoryAnalyzer:
+    """
+    Analyze a sequence of networks that differ from one frame to the next by a small number
+    of added and removed edges.
+
+    Like :obj:`LoopFinder`, the analyzer works with the clusters of nodes that are connected
+    by internal edges (edges that do not cross a boundary) and the reduced network of the
+    boundary-crossing edges between these clusters (see
+    :obj:`PeriodicNetwork.get_reduced_network`). All of these are updated in place:
+
+    * Edges are found through a per-node index of their edge numbers and deleted by moving
+      the last edge into their place (see :obj:`EdgeTable.delete`).
+    * An internal edge that joins two clusters relabels the smaller one. When an internal
+      edge is removed, a breadth-first search is started from both of its nodes at the same
+      time. It stops when the searches meet, or when one of them runs out of nodes, which
+      then form a new cluster. Either way it only visits the neighbourhood of the edge or
+      the smaller part of the cluster.
+    * The boundary-crossing edges are kept in a list, from which the reduced network is
+      labeled on every query that follows a change. Each connected component of the
+      reduced network keeps its loops, and only the components that contain a changed
+      cluster are searched again.
+
+    The analyzer works on its own copy of the edges: the network it is constructed from
+    is not modified.
+
+    Args:
+        network (:obj:`perconet.PeriodicNetwork`): The network of the first frame.
+        verbose (bool, optional): Generate verbose output to stdout.
+    """
+    def __init__(self, network, verbose=False):
+        node_pairs, crossing = network.get_edge_arrays()
+        self.__setup(EdgeTable.from_arrays(node_pairs, crossing), network.get_number_of_nodes(),
+                     network.get_dimension(), verbose)
+
+    @classmethod
+    def _attach(cls, network):
+        """
+        Set up an analyzer that shares the edge table of network, so that the network can
+        make its changes through the analyzer (see :obj:`PeriodicNetwork.remove_edge`).
+        """
+        analyzer = cls.__new__(cls)
+        analyzer.__setup(network.edge_table, network.get_number_of_nodes(),
+                         network.get_dimension(), False)
+        return analyzer
+
+    def __setup(self, edges, n, dim, verbose):
+        self.verbose = verbose
+        self.dimension = dim
+        self.number_of_nodes = n
+        self.edges = edges
+        self.__index_edges()
+        node_pairs = edges.get_node_pairs()
+        across = np.any(edges.get_crossing() != 0, axis=1)
+        # the numbers of the boundary-crossing edges, and the position in that list of every
+        # edge (-1 for internal edges)
+        self.boundary = np.nonzero(across)[0]
+        self.n_boundary = len(self.boundary)
+        self.boundary_position = -1 * np.ones(len(edges.nodes), dtype=int)
+        self.boundary_position[self.boundary] = np.arange(self.n_boundary)
+        # the internal cluster of each node. labels are not reused, so the labels of
+        # clusters that are not touched by a change remain valid
+        internal = node_pairs[~across]
+        self.labels, self.next_label = graphtools.component_labels(n, internal[:, 0],
+                                                                   internal[:, 1])
+        self.cluster_size = np.bincount(self.labels, minlength=self.next_label)
+        # nodes of clusters that changed since the last query
+        self.touched = set()
+        # the loops of every component of the reduced network that has any, indexed by its
+        # smallest cluster label, which stays the same as long as the component is untouched
+        self.bases = {}
+        self.reduced_clusters = None
+        self.reduced_keys = None
+        self.loops = None
+        # queries update the changed components, so two queries must not do so at once
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # a lock can not be pickled. the copy gets its own lock
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __index_edges(self):
+        """
+        Set up the index of the edge numbers of every node. Deleted edges are marked with -1
+        and new edges are kept in per-node lists, until there are so many of these that the
+        index is set up again.
+        """
+        node_pairs = self.edges.get_node_pairs()
+        _, _, self.incident, _, self.offsets = graphtools.sort_half_edges(
+            node_pairs[:, 0], node_pairs[:, 1], np.zeros((len(node_pairs), 0), dtype=int),
+            self.number_of_nodes)
+        self.new_incident = {}
+        self.n_stale = 0
+
+    def __incident(self, node):
+        """Get the numbers of the edges of node."""
+        edges = self.incident[self.offsets[node]:self.offsets[node + 1]]
+        new_edges = self.new_incident.get(node)
+        if new_edges:
+            edges = np.concatenate((edges, new_edges))
+        return edges[edges >= 0]
+
+    def __replace_incident(self, node, old, new):
+        """Replace edge number old by new (or remove it if new is -1) in the index of node."""
+        start = self.offsets[node]
+        found = np.nonzero(self.incident[start:self.offsets[node + 1]] == old)[0]
+        if len(found) > 0:
+            self.incident[start + found[0]] = new
+            return
+        new_edges = self.new_incident[node]
+        if new < 0:
+            new_edges.remove(old)
+        else:
+            new_edges[new_edges.index(old)] = new
+
+    def __internal_neighbors(self, node):
+        """Get the nodes that are connected to node by an internal edge."""
+        edges = self.__incident(node)
+        node_pairs = self.edges.nodes[edges[self.boundary_position[edges] < 0]]
+        return np.where(node_pairs[:, 0] == node, node_pairs[:, 1], node_pairs[:, 0]).tolist()
+
+    def __new_label(self):
+        label = self.next_label
+        self.next_label += 1
+        self.cluster_size = _grow(self.cluster_size, self.next_label, 0)
+        return label
+
+    def __join(self, node1, node2):
+        """Join the clusters of node1 and node2 by relabeling the smaller one."""
+        if self.cluster_size[self.labels[node1]] < self.cluster_size[self.labels[node2]]:
+            node1, node2 = node2, node1
+        label = self.labels[node1]
+        old_label = self.labels[node2]
+        if self.cluster_size[old_label] > _SEARCH_LIMIT:
+            nodes = np.nonzero(self.labels == old_label)[0]
+        else:
+            nodes = [node2]
+            seen = {node2}
+            for node in nodes:
+                for neighbor in self.__internal_neighbors(node):
+                    if neighbor not in seen and self.labels[neighbor] == old_label:
+                        seen.add(neighbor)
+                        nodes.append(neighbor)
+        self.labels[nodes] = label
+        self.cluster_size[label] += self.cluster_size[old_label]
+        self.cluster_size[old_label] = 0
+
+    def __split(self, node1, node2):
+        """
+        Check if the cluster of node1 and node2 fell apart after the removal of an internal
+        edge between them, and if so give the part that was searched completely a new label.
+
+        Returns:
+            bool: True if the cluster fell apart.
+        """
+        queues = ([node1], [node2])
+        seen = ({node1}, {node2})
+        heads = [0, 0]
+        while True:
+            for side in (0, 1):
+                queue = queues[side]
+                if heads[side] == len(queue):
+                    # this part of the cluster is cut off from the other node
+                    old_label = self.labels[node1]
+                    label = self.__new_label()
+                    self.labels[queue] = label
+                    self.cluster_size[label] = len(queue)
+                    self.cluster_size[old_label] -= len(queue)
+                    return True
+                node = queue[heads[side]]
+                heads[side] += 1
+                for neighbor in self.__internal_neighbors(node):
+                    if neighbor in seen[1 - side]:
+                        return False
+                    if neighbor not in seen[side]:
+                        seen[side].add(neighbor)
+                        queue.append(neighbor)
+
+    def __add_boundary(self, edge):
+        self.boundary = _grow(self.boundary, self.n_boundary + 1, -1)
+        self.boundary[self.n_boundary] = edge
+        self.boundary_position[edge] = self.n_boundary
+        self.n_boundary += 1
+
+    def __remove_boundary(self, edge):
+        position = self.boundary_position[edge]
+        last = self.boundary[self.n_boundary - 1]
+        self.boundary[position] = last
+        self.boundary_position[last] = position
+        self.boundary_position[edge] = -1
+        self.n_boundary -= 1
+
+    def __check_index(self):
+        """Set up the index of the edges of every node again if it has many stale entries."""
+        self.n_stale += 1
+        if self.n_stale > len(self.incident) // 2 + 64:
+            self.__index_edges()
+
+    def _find_edge(self, node1, node2, boundary_vector):
+        """
+        Find an edge, see :obj:`EdgeTable.find`, using the edges of node1 only.
+
+        Returns:
+            int: The edge number, or -1 if there is no such edge.
+        """
+        return self.edges.find(node1, node2, boundary_vector, self.__incident(node1))
+
+    def _add_edge(self, node1, node2, boundary_vector):
+        """
+        Append an edge to the edge table and update the clusters.
+
+        Returns:
+            int: The number of the new edge.
+        """
+        edge = self.edges.append(node1, node2, boundary_vector)
+        self.boundary_position = _grow(self.boundary_position, len(self.edges.nodes), -1)
+        for node in {node1, node2}:
+            self.new_incident.setdefault(node, []).append(edge)
+        if any(boundary_vector):
+            self.__add_boundary(edge)
+            self.touched.update((node1, node2))
+        elif self.labels[node1] != self.labels[node2]:
+            self.__join(node1, node2)
+            self.touched.update((node1, node2))
+        self.__check_index()
+        return edge
+
+    def _remove_edge(self, edge):
+        """
+        Delete an edge from the edge table (see :obj:`EdgeTable.delete`) and update the
+        clusters.
+
+        Returns:
+            int: The former number of the edge that took its place, or -1.
+        """
+        node1, node2 = self.edges.nodes[edge].tolist()
+        is_boundary = self.boundary_position[edge] >= 0
+        for node in {node1, node2}:
+            self.__replace_incident(node, edge, -1)
+        if is_boundary:
+            self.__remove_boundary(edge)
+        moved = self.edges.delete(edge)
+        if moved != -1:
+            for node in set(self.edges.nodes[edge].tolist()):
+                self.__replace_incident(node, moved, edge)
+            position = self.boundary_position[moved]
+            self.boundary_position[edge] = position
+            self.boundary_position[moved] = -1
+            if position >= 0:
+                self.boundary[position] = edge
+        if is_boundary or (node1 != node2 and self.__split(node1, node2)):
+            self.touched.update((node1, node2))
+        self.__check_index()
+        return moved
+
+    def _cluster_labels(self):
+        """
+        Get the internal clusters, numbered as by :obj:`PeriodicNetwork.decompose`.
+
+        Returns:
+            Tuple[:obj:`numpy.ndarray`, int]: The cluster of every node and the number of
+            clusters.
+        """
+        _, first, labels = np.unique(self.labels, return_index=True, return_inverse=True)
+        # renumber in order of the smallest node index of each cluster
+        rank = np.empty(len(first), dtype=int)
+        rank[np.argsort(first)] = np.arange(len(first))
+        return rank[labels], len(first)
+
+    def _boundary_edges(self):
+        """Get the numbers of the boundary-crossing edges (in no particular order)."""
+        return self.boundary[:self.n_boundary]
+
+    def __check_edge(self, node1, node2, boundary_vector):
+        if not (0 <= node1 < self.number_of_nodes and 0 <= node2 < self.number_of_nodes):
+            raise ValueError(f"Invalid edge ({node1}, {node2}) for a network with "
+                             f"{self.number_of_nodes} nodes.")
+        if len(boundary_vector) != self.dimension:
+            raise ValueError(f"Boundary-crossing vector {boundary_vector} does not have "
+                             f"dimension {self.dimension}.")
+
+    def __refresh(self):
+        """Search the components of the reduced network that changed since the last query."""
+        with self.lock:
+            if self.loops is not None and len(self.touched) == 0:
+                return
+            edges = self.boundary[:self.n_boundary]
+            if len(edges) == 0:
+                self.__set_bases({}, np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+                return
+            crossing = self.edges.crossing[edges]
+            clusters, reduced_pairs = np.unique(self.labels[self.edges.nodes[edges]],
+                                                return_inverse=True)
+            reduced_pairs = reduced_pairs.reshape(-1, 2)
+            component, n_components = graphtools.component_labels(
+                len(clusters), reduced_pairs[:, 0], reduced_pairs[:, 1])
+            # components are numbered in order of their smallest cluster label
+            _, first = np.unique(component, return_index=True)
+            keys = clusters[first]
+            if self.loops is None:
+                changed = np.ones(n_components, dtype=bool)
+            else:
+                labels = self.labels[np.fromiter(self.touched, dtype=int)]
+                position = np.minimum(np.searchsorted(clusters, labels), len(clusters) - 1)
+                position = position[clusters[position] == labels]
+                changed = np.zeros(n_components, dtype=bool)
+                changed[component[position]] = True
+            # keep the loops of the components that still exist and did not change
+            bases = {}
+            for key, basis in self.bases.items():
+                index = min(int(np.searchsorted(keys, key)), n_components - 1)
+                if keys[index] == key and not changed[index]:
+                    bases[key] = basis
+            selected = changed[component[reduced_pairs[:, 0]]]
+            new_bases = _component_bases(len(clusters), reduced_pairs[selected, 0],
+                                         reduced_pairs[selected, 1], crossing[selected],
+                                         component)
+            for index, basis in new_bases.items():
+                bases[int(keys[index])] = basis
+            self.__set_bases(bases, clusters, keys[component])
+            if self.verbose:
+                print(f"Searched {int(np.count_nonzero(changed))} of {n_components} "
+                      f"components of the reduced network")
+
+    def __set_bases(self, bases, clusters, keys):
+        """Store the loops of the components of the reduced network and combine them."""
+        self.bases = bases
+        self.reduced_clusters = clusters
+        self.reduced_keys = keys
+        loops, _, n_loops = looptools.hermite_normal_form(
+            np.concatenate([np.zeros((0, self.dimension), dtype=np.int64)] +
+                           list(bases.values())),
+            compute_transform=False)
+        loops.flags.writeable = False
+        self.loops = (loops, n_loops)
+        self.touched = set()
+
+    def apply_diff(self, added=(), removed=()):
+        """
+        Go to the next frame by adding and removing edges.
+
+        The clusters are updated right away. The components of the reduced network that
+        contain a changed cluster are searched when the loops are next requested, so several
+        calls to this method cost no more than a single one that combines them.
+
+        Args:
+            added (:obj:`numpy.ndarray`): Integer array with shape (A, 2 + dim) with one
+                edge per row, as in :obj:`PeriodicNetwork.from_edge_array`.
+            removed (:obj:`numpy.ndarray`): Integer array with shape (R, 2 + dim) with the
+                edges to remove. An edge may be given in either orientation. Edges are
+                removed before the new edges are added.
+        """
+        added = np.asarray(added, dtype=int).reshape(-1, 2 + self.dimension).tolist()
+        removed = np.asarray(removed, dtype=int).reshape(-1, 2 + self.dimension).tolist()
+        for node1, node2, *boundary_vector in removed:
+            self.__check_edge(node1, node2, boundary_vector)
+            edge = self._find_edge(node1, node2, boundary_vector)
+            if edge == -1:
+                raise ValueError(f"Cannot remove edge ({node1}, {node2}, {boundary_vector}): "
+                                 "no such edge.")
+            self._remove_edge(edge)
+        for node1, node2, *boundary_vector in added:
+            self.__check_edge(node1, node2, boundary_vector)
+            self._add_edge(node1, node2, boundary_vector)
+
+    def get_independent_loops(self):
+        """
+        Get all linearly independent topologically nontrivial loops of the current frame.
+
+        Returns:
+            Tuple[:obj:`numpy.ndarray`, int]: The loops in Hermite normal form and their
+            number, as in :obj:`LoopFinder.get_independent_loops`. The array is shared
+            with later calls and can not be modified.
+        """
+        self.__refresh()
+        return self.loops
+
+    def current_percolation_rank(self, node=None):
+        """
+        Get the percolation dimension of the current frame.
+
+        Args:
+            node (int, optional): If given, return the percolation dimension of the connected
+                component (using all edges) that contains this node instead of that of the
+                network as a whole.
+
+        Returns:
+            int: The number of independent directions in which the network (or component)
+            percolates.
+        """
+        if node is None:
+            return self.get_independent_loops()[1]
+        self.__refresh()
+        label = self.labels[node]
+        index = int(np.searchsorted(self.reduced_clusters, label))
+        if index == len(self.reduced_clusters) or self.reduced_clusters[index] != label:
+            # the cluster has no boundary-crossing edges
+            return 0
+        return len(self.bases.get(int(self.reduced_keys[index]), ()))
+
+
+def analyze_trajectory(network, diffs, verbose=False):
+    """
+    Find the independent loops of every frame of a trajectory, given as a first network
+    and the edges that are added and removed from one frame to the next.
+    See :obj:`TrajectoryAnalyzer`.
+
+    Args:
+        network (:obj:`perconet.PeriodicNetwork`): The network of the first frame.
+        diffs (iterable): One (added, removed) tuple of edge arrays per subsequent frame,
+            see :obj:`TrajectoryAnalyzer.apply_diff`. This can be a generator.
+        verbose (bool, optional): Generate verbose output to stdout.
+
+    Yields:
+        Tuple[:obj:`numpy.ndarray`, int]: The independent loops of each frame and their
+        number, starting with the first frame.
+    """
+    analyzer = TrajectoryAnalyzer(network, verbose=verbose)
+    yield analyzer.get_independent_loops()
+    for added, removed in diffs:
+        analyzer.apply_diff(added, removed)
+        yield analyzer.get_independent_loops()
@@ -27,3 +27,9 @@ def initialize_test(bondlist):
     for bond in bondlist:
         assert network.add_edge(bond[0], bond[1], bond[2:])
     return network
+
+
+def sample_bondlists(set_ids=(0, 50, 80), ifiles=(0, 9)):
+    """Load a selection of the bond files in tests/testdata as integer arrays."""
+    return [np.loadtxt(f"tests/testdata/bonds_{set_id}_{ifile:02}.dat", dtype=int)
+            for set_id in set_ids for ifile in ifiles]
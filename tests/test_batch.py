@@ -0,0 +1,91 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import os
+import time
+import perconet as pn
+import numpy as np
+import pytest
+
+
+def test_analyze_many():
+    nloops = np.concatenate([np.loadtxt(f"tests/testdata/bonds_{set_id}_loops.dat", dtype=int)
+                             for set_id in [20, 60]])
+    paths = [f"tests/testdata/bonds_{set_id}_{ifile:02}.dat"
+             for set_id in [20, 60] for ifile in range(len(nloops) // 2)]
+    for workers in [1, 2]:
+        # a generator input is consumed lazily. mix paths and arrays
+        snapshots = (np.loadtxt(path, dtype=int) if i % 3 == 0 else path
+                     for i, path in enumerate(paths))
+        results = list(pn.analyze_many(snapshots, workers=workers, chunk_size=3,
+                                       max_pending=2))
+        assert len(results) == len(paths)
+        assert [n_loops for _, n_loops in results] == nloops.tolist()
+    loops, n_loops = pn.analyze_snapshot(paths[-1])
+    assert np.all(results[-1][0] == loops)
+    with pytest.raises(ValueError):
+        next(pn.analyze_many(paths, chunk_size=0))
+
+
+def test_result_cache(tmp_path, monkeypatch):
+    bondlist = np.loadtxt("tests/testdata/bonds_60_02.dat", dtype=int)
+    network = pn.PeriodicNetwork.from_edge_array(bondlist)
+    # the fingerprint does not depend on edge order, orientation, storage or dtypes
+    rng = np.random.default_rng(3)
+    shuffled = bondlist[rng.permutation(len(bondlist))]
+    shuffled[::2] = np.concatenate((shuffled[::2, 1::-1], -shuffled[::2, 2:]), axis=1)
+    same = pn.PeriodicNetwork.from_edge_array(shuffled, storage="csr", index_dtype=np.int32,
+                                              crossing_dtype=np.int8)
+    assert same.fingerprint() == network.fingerprint()
+    other = pn.PeriodicNetwork.from_edge_array(bondlist[1:], n=network.number_of_nodes)
+    assert other.fingerprint() != network.fingerprint()
+    cache = pn.ResultCache(tmp_path / "cache")
+    loops, n_loops = cache.get_independent_loops(network)
+    reduced = network.get_reduced_network()
+    # a network with the same fingerprint is not searched again
+    monkeypatch.setattr(pn.resultcache, "LoopFinder", None)
+    cached_loops, cached_n_loops = cache.get_independent_loops(same)
+    assert cached_n_loops == n_loops
+    assert np.all(cached_loops == loops)
+    cached_reduced = cache.get_reduced_network(same)
+    assert cached_reduced.get_number_of_nodes() == reduced.get_number_of_nodes()
+    for ours, theirs in zip(cached_reduced.get_edge_arrays(), reduced.get_edge_arrays()):
+        assert np.all(ours == theirs)
+    monkeypatch.undo()
+    # the least recently used results are evicted
+    paths = [f"tests/testdata/bonds_20_{ifile:02}.dat" for ifile in range(6)]
+    entry_size = (tmp_path / "cache" / (network.fingerprint() + ".npz")).stat().st_size
+    small_cache = pn.ResultCache(tmp_path / "small", max_bytes=int(2.5 * entry_size))
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scans.append(path) or scandir(path))
+    results = list(pn.analyze_many(paths, workers=1, cache=small_cache))
+    monkeypatch.undo()
+    assert 0 < len(list((tmp_path / "small").iterdir())) < len(paths)
+    # the directory is scanned once at first and then only when it is full
+    assert len(scans) < len(paths)
+    assert small_cache.total_bytes <= small_cache.max_bytes
+    rerun = pn.analyze_many(paths, workers=2, cache=cache)
+    for (ours, our_n), (theirs, their_n) in zip(results, rerun):
+        assert our_n == their_n
+        assert np.all(np.asarray(ours).reshape(-1, 3) == np.asarray(theirs).reshape(-1, 3))
+    assert len(list((tmp_path / "cache").iterdir())) == len(paths) + 1
+    # a corrupt entry is a cache miss
+    (tmp_path / "cache" / (network.fingerprint() + ".npz")).write_bytes(b"PK\x03\x04corrupt")
+    assert cache.get_independent_loops(network)[1] == n_loops
+    # temporary files left behind by a killed process are removed when they are stale
+    stale = tmp_path / "small" / "stale.tmp"
+    fresh = tmp_path / "small" / "fresh.tmp"
+    stale.write_bytes(b"partial")
+    fresh.write_bytes(b"partial")
+    old = time.time() - 2 * pn.resultcache.STALE_TEMPORARY_AGE
+    os.utime(stale, (old, old))
+    small_cache.evict()
+    assert not stale.exists()
+    assert fresh.exists()
@@ -11,7 +11,7 @@
 import perconet as pn
 import numpy as np
 import networkdata_testing as ndata
-from pn_test_helpers import initialize_test
+from pn_test_helpers import initialize_test, sample_bondlists
 
 
 def test_loops():
@@ -65,7 +65,8 @@ def test_reduction_C():
     assert network.get_number_of_edges() == len(edgelist)  # =23
     network = network.get_reduced_network()
     assert network.get_number_of_nodes() == 5
-    assert network.get_number_of_edges() == 14
+    # 14 distinct reduced edges, 2 of which are the reverse of another one
+    assert network.get_number_of_edges() == 12
     loopfinder = pn.LoopFinder(network, verbose=False)
     loops, n_loops = loopfinder.get_independent_loops()
     assert n_loops == 3
@@ -82,12 +83,224 @@ def test_duplicate_removal_C():
     assert network.get_number_of_edges() == len(edgelist)  # =22
     network = network.get_reduced_network()
     assert network.get_number_of_nodes() == 5
-    assert network.get_number_of_edges() == 14
+    # 14 distinct reduced edges, 2 of which are the reverse of another one
+    assert network.get_number_of_edges() == 12
     loopfinder = pn.LoopFinder(network, verbose=False)
     loops, n_loops = loopfinder.get_independent_loops()
     assert n_loops == 3
 
 
+def test_harvest_loops():
+    edgelist, solution = ndata.testcase_C
+    network = initialize_test(edgelist)
+    reduced_network = network.get_reduced_network()
+    searched_network, loops = network.get_reduced_network(harvest_loops=True)
+    node_pairs, _ = reduced_network.get_edge_arrays()
+    node_pairs = np.unique(node_pairs, axis=0)
+    # one edge remains for each pair of distinct clusters, all other edges become loops
+    n_pairs = np.count_nonzero(node_pairs[:, 0] != node_pairs[:, 1])
+    assert searched_network.get_number_of_nodes() == reduced_network.get_number_of_nodes()
+    assert searched_network.get_number_of_edges() == n_pairs
+    assert len(loops) == reduced_network.get_number_of_edges() - n_pairs
+    # cluster bonded to its own periodic image in both directions: a single loop
+    network = pn.PeriodicNetwork(3, max_degree=4)
+    assert network.add_edge(0, 1, [0, 0, 0])
+    assert network.add_edge(1, 0, [0, 1, 0])
+    assert network.add_edge(0, 1, [0, -1, 0])
+    assert network.add_edge(2, 0, [0, 0, 1])
+    searched_network, loops = network.get_reduced_network(harvest_loops=True)
+    assert searched_network.get_number_of_edges() == 1
+    assert np.all(loops == [[0, 1, 0]])
+
+
+def test_engines_agree():
+    edgelists = [ndata.edgelist_B, ndata.edgelist_C, ndata.edgelist_D,
+                 np.loadtxt("tests/testdata/bonds_60_07.dat", dtype=int)]
+    for edgelist in edgelists:
+        network = initialize_test(edgelist)
+        tree_finder = pn.LoopFinder(network, verbose=False, engine="tree")
+        dfs_finder = pn.LoopFinder(network, verbose=False, engine="dfs")
+        tree_loops = tree_finder.get_loop_array()
+        assert tree_loops.shape == (len(dfs_finder.get_loops()), 3)
+        loops, n_loops = tree_finder.get_independent_loops()
+        dfs_loops, dfs_n_loops = dfs_finder.get_independent_loops()
+        assert n_loops == dfs_n_loops
+        # the Hermite normal form is unique so the results must be identical
+        assert np.all(loops == dfs_loops)
+
+
+def test_streaming():
+    edgelists = [ndata.edgelist_noloops, ndata.edgelist_A, ndata.edgelist_B,
+                 ndata.edgelist_C, ndata.edgelist_D]
+    edgelists += sample_bondlists()
+    for edgelist in edgelists:
+        loopfinder = pn.LoopFinder(initialize_test(edgelist), verbose=False)
+        loops, n_loops = loopfinder.get_independent_loops()
+        stream_loops, stream_n_loops = loopfinder.get_independent_loops(streaming=True)
+        assert stream_n_loops == n_loops
+        if n_loops > 0:
+            assert np.all(stream_loops == loops)
+    # a full-rank basis that spans a sublattice is refined by later chunks
+    selfloops = np.array([[i, i, 2] for i in range(64)] + [[64, 64, 1]])
+    loopfinder = pn.LoopFinder(pn.PeriodicNetwork.from_edge_array(selfloops), verbose=False)
+    stream_loops, stream_n_loops = loopfinder.get_independent_loops(streaming=True)
+    assert stream_n_loops == 1
+    assert np.all(stream_loops == [[1]])
+    assert np.all(loopfinder.get_independent_loops()[0] == [[1]])
+
+
+def test_iter_loops():
+    edgelist = np.loadtxt("tests/testdata/bonds_80_03.dat", dtype=int)
+    loopfinder = pn.LoopFinder(initialize_test(edgelist), verbose=False, engine="dfs")
+    chunks = list(loopfinder.iter_loops(chunk_size=3))
+    assert all(1 <= len(chunk) <= 3 for chunk in chunks)
+    assert np.all(np.concatenate(chunks) == loopfinder.get_loop_array())
+
+
+def test_long_chain():
+    # a ring that is much deeper than the default recursion limit
+    n = 5000
+    ring = np.zeros((n, 5), dtype=int)
+    ring[:, 0] = np.arange(n)
+    ring[:, 1] = (np.arange(n) + 1) % n
+    ring[:, 2] = 1
+    network = pn.PeriodicNetwork.from_edge_array(ring)
+    for engine in ["tree", "dfs"]:
+        loopfinder = pn.LoopFinder(network, verbose=False, engine=engine)
+        loops = loopfinder.get_loops()
+        assert len(loops) == 1
+        assert np.all(np.abs(loops[0]) == [n, 0, 0])
+        loops, n_loops = loopfinder.get_independent_loops()
+        assert n_loops == 1
+        assert np.all(loops[0] == [n, 0, 0])
+
+
+def test_prune():
+    # two rings connected by a bridge (3-4), with a dangling chain (6-7-8) on the second ring
+    edgelist = np.array([[0, 1, 1, 0], [1, 2, 0, 0], [2, 0, 0, 0],
+                         [3, 4, 0, 0],
+                         [4, 5, 0, 1], [5, 3, 0, 0], [3, 4, 0, 0],
+                         [0, 3, 0, 0],
+                         [5, 6, 1, 0], [6, 7, 0, 1], [7, 8, 1, 1]])
+    core, pruned = pn.PeriodicNetwork.from_edge_array(edgelist).get_core_network()
+    assert pruned == {"leaf_edges": 3, "bridges": 1, "nodes": 3}
+    assert core.get_number_of_nodes() == 6
+    assert core.get_number_of_edges() == 7
+    edgelists = [ndata.edgelist_noloops, ndata.edgelist_B, ndata.edgelist_C, edgelist]
+    edgelists += sample_bondlists()
+    for edgelist in edgelists:
+        network = pn.PeriodicNetwork.from_edge_array(edgelist)
+        loops, n_loops = pn.LoopFinder(network, verbose=False).get_independent_loops()
+        for engine in ["tree", "dfs"]:
+            loopfinder = pn.LoopFinder(network, verbose=False, engine=engine, prune=True)
+            pruned_loops, pruned_n_loops = loopfinder.get_independent_loops()
+            assert pruned_n_loops == n_loops
+            assert np.all(pruned_loops == loops)
+            if network.crosses_boundaries():
+                assert set(loopfinder.pruned) == {"leaf_edges", "bridges", "nodes"}
+        # the pruning counts belong to the search, not to the LoopFinder
+        assert pn.LoopFinder(network, verbose=False, engine=engine).pruned is None
+
+
+def test_contract_chains():
+    # a ring of 1000 nodes that wraps around the x boundary once, with a branch
+    # from node 0 to node 500 that wraps around the y boundary
+    n = 1000
+    ring = np.zeros((n, 5), dtype=int)
+    ring[:, 0] = np.arange(n)
+    ring[:, 1] = (np.arange(n) + 1) % n
+    ring[-1, 2] = 1
+    branch = np.array([[0, 1000, 0, 1, 0], [1000, 500, 0, 0, 0]])
+    network = pn.PeriodicNetwork.from_edge_array(np.concatenate((ring, branch)),
+                                                 storage="csr")
+    reduced, loops = network.get_reduced_network(harvest_loops=True, contract_chains=True)
+    # the whole network contracts to two parallel edges and one loop is left to find
+    assert reduced.get_number_of_edges() + len(loops) == 2
+    loops, n_loops = pn.LoopFinder(network, verbose=False,
+                                   contract_chains=True).get_independent_loops()
+    assert n_loops == 2
+    assert np.all(loops == [[1, 0, 0], [0, 1, 0]])
+    # without harvesting, the ring is contracted to a single node with a self-loop
+    reduced = pn.PeriodicNetwork.from_edge_array(ring).get_reduced_network(contract_chains=True)
+    assert reduced.get_number_of_nodes() == 1
+    assert reduced.simple_boundary_crossing == [[1, 0, 0]]
+    edgelists = [ndata.edgelist_noloops, ndata.edgelist_B, ndata.edgelist_C, ndata.edgelist_D]
+    edgelists += sample_bondlists()
+    for edgelist in edgelists:
+        network = pn.PeriodicNetwork.from_edge_array(edgelist)
+        loops, n_loops = pn.LoopFinder(network, verbose=False).get_independent_loops()
+        for engine in ["tree", "dfs"]:
+            loopfinder = pn.LoopFinder(network, verbose=False, engine=engine,
+                                       contract_chains=True, prune=True)
+            contracted_loops, contracted_n_loops = loopfinder.get_independent_loops()
+            assert contracted_n_loops == n_loops
+            assert np.all(contracted_loops == loops)
+
+
+def test_threads():
+    import concurrent.futures
+    networks = [pn.PeriodicNetwork.from_edge_array(
+                np.loadtxt(f"tests/testdata/bonds_{set_id}_03.dat", dtype=int))
+                for set_id in [20, 60, 80]]
+    expected = [pn.LoopFinder(network, verbose=False).get_independent_loops()[1]
+                for network in networks]
+    # one LoopFinder per network, each shared by many concurrent searches
+    loopfinders = [pn.LoopFinder(network, verbose=False, engine="dfs") for network in networks]
+    tasks = [i % len(networks) for i in range(60)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: loopfinders[i].get_independent_loops()[1], tasks))
+    assert results == [expected[i] for i in tasks]
+    # iterators of the same LoopFinder do not share their search state
+    loopfinder = loopfinders[2]
+    iterators = [loopfinder.iter_loops(chunk_size=1) for _ in range(2)]
+    chunks = [[], []]
+    for pair in zip(*iterators):
+        for chunks_of_iterator, chunk in zip(chunks, pair):
+            chunks_of_iterator.append(chunk)
+    assert np.all(np.concatenate(chunks[0]) == np.concatenate(chunks[1]))
+    assert np.all(np.concatenate(chunks[0]) == np.concatenate(list(loopfinder.iter_loops())))
+
+
+def test_cache():
+    bondlist = np.loadtxt("tests/testdata/bonds_60_04.dat", dtype=int)
+    network = pn.PeriodicNetwork.from_edge_array(bondlist[:-1])
+    loopfinder = pn.LoopFinder(network, verbose=False)
+    loops = loopfinder.get_loop_array()
+    independent_loops, _ = loopfinder.get_independent_loops()
+    # repeated queries of an unchanged network reuse the results
+    assert loopfinder.get_loop_array() is loops
+    assert loopfinder.get_independent_loops()[0] is independent_loops
+    assert network.get_reduced_network() is network.get_reduced_network()
+    assert network.decompose()[0] is network.decompose()[0]
+    labels = network.decompose()[0]
+    # cached arrays are shared, so they can not be modified by a caller
+    assert not labels.flags.writeable
+    assert not independent_loops.flags.writeable
+    # results for an edge mask are not cached
+    edge_mask = np.ones(len(bondlist) - 1, dtype=bool)
+    assert pn.LoopFinder(network, verbose=False, edge_mask=edge_mask).get_loop_array() \
+        is not loops
+    # modifying the network discards the cached results
+    assert network.add_edge(*bondlist[-1, 0:2], bondlist[-1, 2:])
+    assert network.modification_count == 1
+    assert network.decompose()[0] is not labels
+    reference = pn.LoopFinder(pn.PeriodicNetwork.from_edge_array(bondlist), verbose=False)
+    assert np.all(loopfinder.get_loop_array() == reference.get_loop_array())
+    assert loopfinder.get_percolation_dimension() == reference.get_independent_loops()[1]
+    assert network.remove_edge(*bondlist[0, 0:2], bondlist[0, 2:])
+    assert network.modification_count == 2
+    reference = pn.LoopFinder(pn.PeriodicNetwork.from_edge_array(bondlist[1:],
+                                                                 n=network.number_of_nodes),
+                              verbose=False)
+    assert len(loopfinder.get_loop_array()) == len(reference.get_loop_array())
+    # after a removal, the loops are kept up to date by the analyzer of the network
+    independent_loops, n_loops = loopfinder.get_independent_loops()
+    assert independent_loops is network.trajectory_analyzer.get_independent_loops()[0]
+    assert n_loops == reference.get_independent_loops()[1]
+    assert np.all(independent_loops == reference.get_independent_loops()[0])
+    assert not independent_loops.flags.writeable
+
+
 def oldstuff():
     dropped_list = ndata.edgelist  # use old "dropped_list" terminology below
     # dropped_list has description of boundary-crossing bonds in a reduced network
@@ -0,0 +1,85 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import perconet.looptools as looptools
+import numpy as np
+
+
+def test_hermite_normal_form():
+    rng = np.random.default_rng(1)
+    for m in [1, 2, 5, 40]:
+        for n in [2, 3, 5]:
+            mat = rng.integers(-4, 5, (m, n))
+            r, u, rank = looptools.hermite_normal_form(mat)
+            assert np.all(u @ mat == r)
+            assert rank == np.linalg.matrix_rank(mat)
+            assert not np.any(r[rank:])
+            for chunk_size in [1, 3, 1024]:
+                basis, no_u, basis_rank = \
+                    looptools.hermite_normal_form(mat, compute_transform=False,
+                                                  chunk_size=chunk_size)
+                assert no_u is None
+                assert basis_rank == rank
+                assert np.all(basis == r[:rank])
+
+
+def test_extend_basis():
+    rng = np.random.default_rng(2)
+    mat = rng.integers(-3, 4, (30, 3))
+    basis = np.zeros((0, 3), dtype=int)
+    for row in mat:
+        basis = looptools.extend_basis(basis, row[np.newaxis, :])
+    r, _, rank = looptools.hermite_normal_form(mat)
+    assert np.all(basis == r[:rank])
+
+
+def test_hermite_normal_form_overflow():
+    # eliminating the first column multiplies the large entries by 2**30
+    mat = np.array([[1, 2**40, 0], [2**30, 0, 1], [0, 3, 2**35]], dtype=np.int64)
+    exact = mat.astype(object)
+    r_exact, u_exact, rank_exact = looptools.hermite_normal_form(exact)
+    assert np.all(u_exact.dot(exact) == r_exact)
+    assert rank_exact == 3
+    count = looptools.slow_path_count
+    r, u, rank = looptools.hermite_normal_form(mat)
+    assert looptools.slow_path_count == count + 1
+    assert rank == rank_exact
+    assert np.all(r == r_exact)
+    assert np.all(u.dot(exact) == r_exact)
+    basis, _, rank = looptools.hermite_normal_form(mat, compute_transform=False)
+    assert looptools.slow_path_count == count + 2
+    assert np.all(basis == r_exact)
+    # small entries take the fast path
+    r, u, rank = looptools.hermite_normal_form(np.array([[2, 4], [3, 1]]))
+    assert looptools.slow_path_count == count + 2
+    assert r.dtype != object
+    # the fast path uses int64 regardless of the input dtype and the default integer size
+    r, u, rank = looptools.hermite_normal_form(np.array([[2, 4], [3, 1]], dtype=np.int32))
+    assert r.dtype == np.int64 and u.dtype == np.int64
+    basis, _, _ = looptools.hermite_normal_form(np.array([[2**20, 1], [1, 2**20]],
+                                                         dtype=np.int32),
+                                                compute_transform=False)
+    assert basis.dtype == np.int64
+    assert np.all(basis == [[1, 2**20], [0, 2**40 - 1]])
+
+
+def test_integer_rank():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        m = rng.integers(1, 12)
+        n = rng.integers(1, 6)
+        mat = rng.integers(-3, 4, (m, n))
+        if rng.random() < 0.5:
+            # make the rows linearly dependent
+            mat = mat @ rng.integers(-2, 3, (n, n))
+        assert looptools.integer_rank(mat) == looptools.hermite_normal_form(mat)[2]
+    assert looptools.integer_rank(np.zeros((4, 3), dtype=int)) == 0
+    assert looptools.integer_rank(np.array([[1, 2], [-1, -2], [2, 4]])) == 1
+    big = np.array([[1, 2**40, 0], [2**30, 0, 1], [0, 3, 2**35]], dtype=np.int64) * 64
+    assert looptools.integer_rank(big) == 3
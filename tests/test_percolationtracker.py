@@ -0,0 +1,94 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import perconet as pn
+import numpy as np
+import pytest
+import networkdata_testing as ndata
+
+
+def test_tracker_testcases():
+    for net in dir(ndata):
+        if not net.startswith("edgelist_"):
+            continue
+        edgelist = getattr(ndata, net)
+        n_nodes = edgelist[:, 0:2].max() + 1
+        network = pn.PeriodicNetwork(n_nodes, max_degree=None, storage="csr")
+        assert network.current_percolation_rank() == 0
+        for bond in edgelist:
+            assert network.add_edge(bond[0], bond[1], bond[2:])
+            loopfinder = pn.LoopFinder(network, verbose=False)
+            assert network.current_percolation_rank() == \
+                loopfinder.get_percolation_dimension()
+
+
+def test_tracker_sampledata():
+    for set_id in [20, 60, 80]:
+        nloops = np.loadtxt(f"tests/testdata/bonds_{set_id}_loops.dat", dtype=int)
+        for ifile in [0, 7, 13]:
+            bondlist = np.loadtxt(f"tests/testdata/bonds_{set_id}_{ifile:02}.dat", dtype=int)
+            tracker = pn.PercolationTracker(bondlist[:, 0:2].max() + 1)
+            ranks = [tracker.add_edge(bond[0], bond[1], bond[2:]) for bond in bondlist]
+            assert ranks[-1] == nloops[ifile]
+            # the percolation dimension can only grow while adding edges
+            assert np.all(np.diff(ranks) >= 0)
+
+
+def test_tracker_clusters():
+    tracker = pn.PercolationTracker(5, dim=2)
+    assert tracker.add_edge(0, 1, [1, 0]) == 0
+    assert tracker.add_edge(1, 0, [0, 0]) == 1
+    assert tracker.add_edge(2, 3, [0, 1]) == 1
+    assert tracker.add_edge(3, 2, [0, 0]) == 2
+    # the network percolates in two directions, but each cluster in only one
+    assert tracker.current_percolation_rank(0) == 1
+    assert tracker.current_percolation_rank(3) == 1
+    assert tracker.current_percolation_rank(4) == 0
+    assert tracker.add_edge(1, 2, [5, 5]) == 2
+    assert tracker.current_percolation_rank(0) == 2
+
+
+def test_sweep():
+    bondlist = np.loadtxt("tests/testdata/bonds_80_03.dat", dtype=int)
+    n_nodes = bondlist[:, 0:2].max() + 1
+    # adding the bonds in file order must agree with the tracker
+    thresholds = pn.bond_percolation_sweep(bondlist, order=np.arange(len(bondlist)))
+    tracker = pn.PercolationTracker(n_nodes)
+    ranks = np.array([tracker.add_edge(bond[0], bond[1], bond[2:]) for bond in bondlist])
+    assert thresholds.shape == (1, 3)
+    for k in range(1, 4):
+        if ranks[-1] >= k:
+            assert thresholds[0, k - 1] == np.argmax(ranks >= k) + 1
+        else:
+            assert thresholds[0, k - 1] == -1
+    # sorting by weight is the same as adding in that order
+    weights = np.random.default_rng(5).random(len(bondlist))
+    assert np.all(pn.bond_percolation_sweep(bondlist, weights=weights) ==
+                  pn.bond_percolation_sweep(bondlist, order=np.argsort(weights)))
+    random_thresholds = pn.bond_percolation_sweep(bondlist, realizations=5, seed=1)
+    assert random_thresholds.shape == (5, 3)
+    assert np.all(np.diff(random_thresholds, axis=1)[random_thresholds[:, 1:] > 0] >= 0)
+    assert np.all(pn.bond_percolation_sweep(bondlist, realizations=5, seed=1) ==
+                  random_thresholds)
+    average = pn.bond_percolation_sweep(bondlist, realizations=5, seed=1, average=True)
+    assert average.shape == (3,)
+    if np.all(random_thresholds[:, 0] > 0):
+        assert average[0] == np.mean(random_thresholds[:, 0])
+    # a network without loops never percolates
+    average = pn.bond_percolation_sweep(ndata.edgelist_noloops, realizations=2, average=True)
+    assert np.all(np.isnan(average))
+    # no bonds
+    empty = np.zeros((0, 5), dtype=int)
+    assert np.all(pn.bond_percolation_sweep(empty, realizations=3) == -1)
+    assert pn.bond_percolation_sweep(empty, realizations=3).shape == (3, 3)
+    # conflicting arguments
+    with pytest.raises(ValueError):
+        pn.bond_percolation_sweep(bondlist, order=np.arange(len(bondlist)), weights=weights)
+    with pytest.raises(ValueError):
+        pn.bond_percolation_sweep(bondlist, weights=weights, realizations=5)
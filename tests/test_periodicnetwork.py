@@ -0,0 +1,364 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import perconet as pn
+import numpy as np
+import pytest
+import networkdata_testing as ndata
+from pn_test_helpers import initialize_test
+
+
+def assert_same_network(net1, net2):
+    assert net1.get_number_of_nodes() == net2.get_number_of_nodes()
+    assert net1.get_number_of_edges() == net2.get_number_of_edges()
+    assert net1.n_internal_edges == net2.n_internal_edges
+    assert net1.n_boundary_edges == net2.n_boundary_edges
+    assert net1.simple_edges_list == net2.simple_edges_list
+    assert net1.simple_boundary_crossing == net2.simple_boundary_crossing
+    assert net1.bond_is_across_boundary == net2.bond_is_across_boundary
+    for node in range(net1.get_number_of_nodes()):
+        assert np.all(net1.get_neighbors(node, padded=False) ==
+                      net2.get_neighbors(node, padded=False))
+        assert np.all(net1.get_edges(node, padded=False) == net2.get_edges(node, padded=False))
+        for nb_index in range(net1.get_number_of_neighbors(node)):
+            assert np.all(net1.get_boundary_crossing(node, nb_index) ==
+                          net2.get_boundary_crossing(node, nb_index))
+
+
+def test_from_edge_array():
+    for edgelist in [ndata.edgelist_B, ndata.edgelist_C, ndata.edgelist_D,
+                     np.loadtxt("tests/testdata/bonds_40_03.dat", dtype=int)]:
+        reference = initialize_test(edgelist)
+        network = pn.PeriodicNetwork.from_edge_array(edgelist)
+        assert network.max_degree == reference.max_degree
+        assert_same_network(network, reference)
+
+
+def test_from_edge_array_selfbond():
+    network = pn.PeriodicNetwork.from_edge_array([[0, 0, 1, 0, 0], [0, 1, 0, 0, 0]], n=3)
+    assert network.get_number_of_nodes() == 3
+    assert network.get_number_of_neighbors(0) == 2
+    assert network.get_number_of_neighbors(1) == 1
+    assert network.get_number_of_neighbors(2) == 0
+    loops, n_loops = pn.LoopFinder(network, verbose=False).get_independent_loops()
+    assert n_loops == 1
+
+
+def test_from_edge_array_errors():
+    with pytest.raises(ValueError, match=r"rows \[1, 3\]"):
+        pn.PeriodicNetwork.from_edge_array([[0, 1, 0, 0, 0],
+                                            [0, 5, 0, 0, 0],
+                                            [1, 2, 1, 0, 0],
+                                            [-1, 2, 1, 0, 0]], n=4)
+    with pytest.raises(ValueError, match=r"max_degree = 1 in rows \[1\]"):
+        pn.PeriodicNetwork.from_edge_array([[0, 1, 0, 0, 0], [1, 2, 1, 0, 0]], max_degree=1)
+    with pytest.raises(ValueError):
+        pn.PeriodicNetwork.from_edge_array([[0, 1, 0, 0, 0]], dim=2)
+    with pytest.raises(ValueError):
+        pn.PeriodicNetwork.from_edge_array([[0, 1, 0.5, 0, 0]])
+
+
+def test_csr_storage():
+    for edgelist in [ndata.edgelist_B, ndata.edgelist_C, ndata.edgelist_D,
+                     np.loadtxt("tests/testdata/bonds_40_03.dat", dtype=int)]:
+        reference = initialize_test(edgelist)
+        network = pn.PeriodicNetwork(reference.get_number_of_nodes(), max_degree=None,
+                                     storage="csr")
+        assert network.neighbors is None
+        for bond in edgelist:
+            assert network.add_edge(bond[0], bond[1], bond[2:])
+        assert_same_network(network, reference)
+        assert_same_network(pn.PeriodicNetwork.from_edge_array(edgelist, storage="csr"),
+                            reference)
+        assert np.all(network.get_neighbors(0) == reference.get_neighbors(0))
+        assert np.all(network.decompose()[0] == reference.decompose()[0])
+        assert_same_network(network.get_reduced_network(), reference.get_reduced_network())
+        # internal networks never allocate padded arrays
+        if reference.needs_reducing():
+            assert reference.get_reduced_network().neighbors is None
+        assert reference.get_core_network()[0].storage == "csr"
+        loops, n_loops = pn.LoopFinder(network, verbose=False).get_independent_loops()
+        ref_loops, ref_n_loops = pn.LoopFinder(reference, verbose=False).get_independent_loops()
+        assert n_loops == ref_n_loops
+        assert np.all(loops == ref_loops)
+
+
+def test_csr_heterogeneous_degree():
+    # a single node bonded to all others should not require max_degree
+    n = 1000
+    network = pn.PeriodicNetwork(n, max_degree=None, storage="csr")
+    for node in range(1, n):
+        assert network.add_edge(0, node, [0, 0, 0])
+    assert network.add_edge(1, 2, [1, 0, 0])
+    offsets, neighbors, edges, crossing = network.get_csr()
+    assert len(offsets) == n + 1
+    assert len(neighbors) == 2 * n
+    assert network.get_number_of_neighbors(0) == n - 1
+    assert network.get_neighbor(1, 1) == 2
+    assert network.get_neighbor(1, 2) == -1
+    assert np.all(network.get_boundary_crossing(2, 1) == [-1, 0, 0])
+    assert len(network.get_edges(0, padded=False)) == n - 1
+    # padded lists follow the largest degree as edges are added and removed
+    assert len(network.get_edges(5)) == n - 1
+    assert network.remove_edge(3, 0, [0, 0, 0])
+    assert len(network.get_neighbors(5)) == n - 2
+    loops, n_loops = pn.LoopFinder(network, verbose=False).get_independent_loops()
+    assert n_loops == 1
+
+
+def test_storage_errors():
+    with pytest.raises(ValueError):
+        pn.PeriodicNetwork(5, max_degree=None)
+    with pytest.raises(ValueError):
+        pn.PeriodicNetwork(5, storage="dense")
+
+
+def test_decompose_methods(methods=("auto", "unionfind")):
+    for set_id in [0, 40, 80]:
+        bondlist = np.loadtxt(f"tests/testdata/bonds_{set_id}_05.dat", dtype=int)
+        network = initialize_test(bondlist)
+        for internal_only in [True, False]:
+            labels, n_labels = network.decompose(internal_only=internal_only,
+                                                 method="recursive")
+            for method in methods:
+                test_labels, test_n_labels = network.decompose(internal_only=internal_only,
+                                                               method=method)
+                assert test_n_labels == n_labels
+                assert np.all(test_labels == labels)
+    with pytest.raises(ValueError):
+        network.decompose(method="bfs")
+
+
+def test_decompose_scipy():
+    pytest.importorskip("scipy")
+    test_decompose_methods(methods=("scipy",))
+
+
+def test_decompose_large_cluster():
+    # a single internal chain that is much longer than the default recursion limit
+    n = 20000
+    chain = np.zeros((n - 1, 5), dtype=int)
+    chain[:, 0] = np.arange(n - 1)
+    chain[:, 1] = np.arange(1, n)
+    network = pn.PeriodicNetwork.from_edge_array(chain, n=n + 1, storage="csr")
+    labels, n_labels = network.decompose(method="unionfind")
+    assert n_labels == 2
+    assert np.all(labels[:n] == 0)
+    assert labels[n] == 1
+    assert network.add_edge(0, n - 1, [0, 1, 0])
+    loops, n_loops = pn.LoopFinder(network, verbose=False).get_independent_loops()
+    assert n_loops == 1
+
+
+def test_edge_mask():
+    bondlist = np.loadtxt("tests/testdata/bonds_80_07.dat", dtype=int)
+    n_nodes = bondlist[:, 0:2].max() + 1
+    network = pn.PeriodicNetwork.from_edge_array(bondlist, storage="csr")
+    strength = np.random.default_rng(4).random(len(bondlist))
+    for threshold in [0.0, 0.3, 0.6, 0.9]:
+        mask = strength >= threshold
+        reference = pn.PeriodicNetwork.from_edge_array(bondlist[mask], n=n_nodes,
+                                                       storage="csr")
+        for method in ["unionfind", "recursive"]:
+            labels, n_labels = network.decompose(method=method, edge_mask=mask)
+            ref_labels, ref_n_labels = reference.decompose(method=method)
+            assert n_labels == ref_n_labels
+            assert np.all(labels == ref_labels)
+        assert_same_network(network.get_reduced_network(edge_mask=mask),
+                            reference.get_reduced_network())
+        for engine in ["tree", "dfs"]:
+            loopfinder = pn.LoopFinder(network, verbose=False, engine=engine, edge_mask=mask)
+            loops, n_loops = loopfinder.get_independent_loops()
+            ref_loops, ref_n_loops = \
+                pn.LoopFinder(reference, verbose=False).get_independent_loops()
+            assert n_loops == ref_n_loops
+            assert np.all(loops == ref_loops)
+            assert loopfinder.get_percolation_dimension() == ref_n_loops
+    # a mask without boundary-crossing edges has no loops
+    internal = ~np.any(bondlist[:, 2:] != 0, axis=1)
+    assert pn.LoopFinder(network, verbose=False, edge_mask=internal).get_loops() == []
+    with pytest.raises(ValueError):
+        network.decompose(edge_mask=np.ones(3, dtype=bool))
+    with pytest.raises(ValueError):
+        pn.LoopFinder(network, edge_mask=np.ones(len(bondlist), dtype=int))
+
+
+def test_remove_edge():
+    rng = np.random.default_rng(7)
+    bondlist = np.loadtxt("tests/testdata/bonds_60_02.dat", dtype=int)
+    n_nodes = bondlist[:, 0:2].max() + 1
+    for storage in ["padded", "csr"]:
+        network = pn.PeriodicNetwork.from_edge_array(bondlist, storage=storage)
+        # the rows of bondlist in the order of the edge numbers of the network
+        remaining = list(range(len(bondlist)))
+        for step in range(40):
+            index = remaining[rng.integers(len(remaining))]
+            # of several identical edges, the one with the highest number is removed,
+            # and the last edge takes over its number
+            position = [k for k, i in enumerate(remaining)
+                        if np.all(bondlist[i] == bondlist[index])][-1]
+            index = remaining[position]
+            remaining[position] = remaining[-1]
+            remaining.pop()
+            node1, node2, *boundary_vector = bondlist[index].tolist()
+            if step % 2 == 1:
+                # remove in reverse orientation
+                node1, node2 = node2, node1
+                boundary_vector = [-x for x in boundary_vector]
+            assert network.remove_edge(node1, node2, boundary_vector)
+            if step % 10 == 9:
+                reference = pn.PeriodicNetwork.from_edge_array(bondlist[remaining], n=n_nodes,
+                                                               storage=storage)
+                assert_same_network(network, reference)
+                assert np.all(network.decompose()[0] == reference.decompose()[0])
+                assert np.all(network.nodeid_to_clusterid(network.decompose()[0]) ==
+                              reference.nodeid_to_clusterid(reference.decompose()[0]))
+                ref_loops, ref_n_loops = \
+                    pn.LoopFinder(reference, verbose=False).get_independent_loops()
+                loops, n_loops = pn.LoopFinder(network, verbose=False).get_independent_loops()
+                assert n_loops == ref_n_loops
+                assert np.all(np.asarray(loops).reshape(-1, 3) ==
+                              np.asarray(ref_loops).reshape(-1, 3))
+                assert network.current_percolation_rank() == ref_n_loops
+                assert network.current_percolation_rank(0) == \
+                    reference.current_percolation_rank(0)
+        # the network keeps its clusters and loops up to date from the first removal on
+        assert network.trajectory_analyzer.edges is network.edge_table
+        # edges added after a removal are tracked as well, also by a copy of the network
+        import pickle
+        network = pickle.loads(pickle.dumps(network))
+        node1, node2, *boundary_vector = bondlist[index].tolist()
+        assert network.add_edge(node1, node2, boundary_vector)
+        remaining.append(index)
+        reference = pn.PeriodicNetwork.from_edge_array(bondlist[remaining], n=n_nodes)
+        assert network.trajectory_analyzer.edges is network.edge_table
+        assert pn.LoopFinder(network, verbose=False).get_percolation_dimension() == \
+            pn.LoopFinder(reference, verbose=False).get_percolation_dimension()
+        for ours, theirs in zip(network.get_reduced_network().get_edge_arrays(),
+                                reference.get_reduced_network().get_edge_arrays()):
+            assert np.all(ours == theirs)
+    assert not network.remove_edge(0, 0, [1, 2, 3])
+    assert not network.remove_edge(0, network.get_number_of_nodes(), [0, 0, 0])
+    assert not network.remove_edge(-1, 0, [0, 0, 0])
+
+
+def shared_network_loops(network, edge_mask=None):
+    labels, _ = network.decompose()
+    loops, _ = pn.LoopFinder(network, verbose=False, edge_mask=edge_mask).get_independent_loops()
+    return labels, loops
+
+
+def test_shared_memory():
+    import pickle
+    import concurrent.futures
+    bondlist = np.loadtxt("tests/testdata/bonds_80_05.dat", dtype=int)
+    network = pn.PeriodicNetwork.from_edge_array(bondlist)
+    shared = network.to_shared_memory()
+    try:
+        assert shared.storage == "csr"
+        assert shared.get_number_of_edges() == network.get_number_of_edges()
+        assert shared.n_boundary_edges == network.n_boundary_edges
+        for ours, theirs in zip(shared.get_csr() + shared.get_edge_arrays(),
+                                network.get_csr() + network.get_edge_arrays()):
+            assert np.all(ours == theirs)
+        assert np.all(shared.get_neighbors(3) == network.get_neighbors(3))
+        # only the name is pickled
+        assert len(pickle.dumps(shared)) < 200
+        attached = pn.PeriodicNetwork.from_shared_memory(shared.shared_memory_name)
+        assert not attached.add_edge(0, 1, [0, 0, 0])
+        assert not attached.remove_edge(*bondlist[0, 0:2], bondlist[0, 2:])
+        assert attached.current_percolation_rank() == network.current_percolation_rank()
+        assert np.all(attached.decompose(method="recursive")[0] == network.decompose()[0])
+        attached.close_shared_memory()
+        labels, loops = shared_network_loops(network)
+        halves = [np.arange(len(bondlist)) % 2 == k for k in range(2)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(shared_network_loops, [shared] * 2 + [shared] * 2,
+                                        [None, None] + halves))
+        for shared_labels, shared_loops in results[:2]:
+            assert np.all(shared_labels == labels)
+            assert np.all(shared_loops == loops)
+        for half, (_, shared_loops) in zip(halves, results[2:]):
+            assert np.all(shared_loops == shared_network_loops(network, half)[1])
+    finally:
+        shared.close_shared_memory(unlink=True)
+    empty = pn.PeriodicNetwork(4).to_shared_memory()
+    assert empty.get_number_of_edges() == 0
+    assert pn.LoopFinder(empty, verbose=False).get_independent_loops()[1] == 0
+    empty.close_shared_memory(unlink=True)
+
+
+def test_edge_table():
+    from perconet.edgetable import EdgeTable
+    table = EdgeTable(dim=2, capacity=1)
+    for k in range(5):
+        assert table.append(k, k + 1, [k, -k]) == k
+    assert len(table) == 5
+    assert len(table.nodes) == 8
+    assert table.find(3, 2, [-2, 2]) == 2
+    assert table.find(2, 3, [-2, 2]) == -1
+    assert table.find(1, 2, [1, -1], candidates=[0, 2]) == -1
+    # the last edge takes the place of a deleted edge
+    assert table.delete(1) == 4
+    assert table.get_node_pairs().tolist() == [[0, 1], [4, 5], [2, 3], [3, 4]]
+    assert table.get_crossing()[:, 0].tolist() == [0, 4, 2, 3]
+    assert table.delete(3) == -1
+    assert len(table) == 3
+    # the network only stores fixed-size rows per edge
+    bondlist = np.loadtxt("tests/testdata/bonds_80_05.dat", dtype=int)
+    network = pn.PeriodicNetwork.from_edge_array(bondlist, storage="csr")
+    assert network.edge_table.nbytes() == len(bondlist) * 5 * 8
+    assert network.bond_is_across_boundary == np.any(bondlist[:, 2:] != 0, axis=1).tolist()
+
+
+def test_compact_dtypes():
+    bondlist = np.loadtxt("tests/testdata/bonds_80_05.dat", dtype=int)
+    reference = pn.PeriodicNetwork.from_edge_array(bondlist)
+    ref_loops, ref_n_loops = pn.LoopFinder(reference, verbose=False).get_independent_loops()
+    for storage in ["padded", "csr"]:
+        network = pn.PeriodicNetwork.from_edge_array(bondlist, storage=storage,
+                                                     index_dtype=np.int32,
+                                                     crossing_dtype=np.int8)
+        assert network.get_csr()[1].dtype == np.int32
+        assert network.get_edge_arrays()[1].dtype == np.int8
+        assert network.edge_table.nbytes() == len(bondlist) * (2 * 4 + 3)
+        if storage == "padded":
+            assert network.boundary_crossing.dtype == np.int8
+        for engine in ["tree", "dfs"]:
+            loops, n_loops = pn.LoopFinder(network, verbose=False, engine=engine,
+                                           contract_chains=True).get_independent_loops()
+            assert n_loops == ref_n_loops
+            assert np.all(np.asarray(loops) == np.asarray(ref_loops))
+        assert network.current_percolation_rank() == ref_n_loops
+        # vectors that do not fit are rejected
+        assert not network.add_edge(0, 1, [128, 0, 0])
+        assert network.add_edge(0, 1, [127, 0, 0])
+    with pytest.raises(ValueError, match=r"rows \[1\]"):
+        pn.PeriodicNetwork.from_edge_array([[0, 1, 0, 0, 0], [1, 2, 0, -128, 0]],
+                                           crossing_dtype=np.int8)
+    with pytest.raises(ValueError, match="index dtype"):
+        pn.PeriodicNetwork(10, index_dtype=np.int16)
+    shared = pn.PeriodicNetwork.from_edge_array(bondlist, index_dtype=np.int32,
+                                                crossing_dtype=np.int16).to_shared_memory()
+    try:
+        assert shared.get_csr()[3].dtype == np.int16
+        assert np.all(shared.get_edge_arrays()[0] == bondlist[:, 0:2])
+        assert pn.LoopFinder(shared, verbose=False).get_independent_loops()[1] == ref_n_loops
+    finally:
+        shared.close_shared_memory(unlink=True)
+    # mixed itemsizes with an odd number of nodes and half-edges
+    odd = np.array([[0, 1, 0, 0, 1], [1, 2, 1, 0, 0], [2, 2, 0, 1, 0]])
+    shared = pn.PeriodicNetwork.from_edge_array(odd, index_dtype=np.int32).to_shared_memory()
+    try:
+        assert all(array.flags.aligned for array in shared.get_csr() + shared.get_edge_arrays())
+        assert pn.LoopFinder(shared, verbose=False).get_independent_loops()[1] == 1
+    finally:
+        shared.close_shared_memory(unlink=True)
+    # sums of narrow vectors are accumulated in a wider dtype
+    assert pn.looptools.integer_rank(np.array([[100, 1], [1, 100]], dtype=np.int8)) == 2
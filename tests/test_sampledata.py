@@ -23,6 +23,7 @@ def single_test_set(set_id):
         _, n_loops = loopfinder.get_independent_loops()
         # _, n_loops = loopfinder._compare_independence_methods()
         assert n_loops == nloops[ifile]
+        assert loopfinder.get_percolation_dimension() == nloops[ifile]
         print(n_loops)
 
 
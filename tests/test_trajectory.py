@@ -0,0 +1,106 @@
+# This file is part of the perconet package
+# (c) 2022 Eindhoven University of Technology
+# Released under EUPL v1.2
+# See LICENSE file for details
+# Contributors:
+# * Chiara Raffaelli
+# * Wouter G. Ellenbroek
+# Contributing: https://github.com/wouterel/perconet
+
+import perconet as pn
+import numpy as np
+import pytest
+
+
+def reference_loops(bonds, n_nodes):
+    network = pn.PeriodicNetwork.from_edge_array(bonds.reshape(-1, 5), n=n_nodes,
+                                                 storage="csr")
+    return pn.LoopFinder(network, verbose=False).get_independent_loops()
+
+
+def test_trajectory():
+    rng = np.random.default_rng(6)
+    bondlist = np.loadtxt("tests/testdata/bonds_60_04.dat", dtype=int)
+    n_nodes = bondlist[:, 0:2].max() + 1
+    present = rng.random(len(bondlist)) < 0.7
+    network = pn.PeriodicNetwork.from_edge_array(bondlist[present], n=n_nodes,
+                                                 storage="csr")
+    diffs = []
+    frames = [present.copy()]
+    for _ in range(30):
+        flip = rng.choice(len(bondlist), size=4, replace=False)
+        added = flip[~present[flip]]
+        removed = flip[present[flip]]
+        present[flip] = ~present[flip]
+        frames.append(present.copy())
+        # removed edges may be given in reverse orientation
+        reverse = np.hstack((bondlist[removed][:, [1, 0]], -bondlist[removed][:, 2:]))
+        diffs.append((bondlist[added], reverse))
+    for frame, (loops, n_loops) in zip(frames, pn.analyze_trajectory(network, diffs)):
+        ref_loops, ref_n_loops = reference_loops(bondlist[frame], n_nodes)
+        assert n_loops == ref_n_loops
+        assert np.all(loops == np.asarray(ref_loops).reshape(-1, 3))
+
+
+def test_trajectory_components():
+    network = pn.PeriodicNetwork.from_edge_array([[0, 1, 1, 0], [1, 0, 0, 0]], n=4, dim=2)
+    analyzer = pn.TrajectoryAnalyzer(network)
+    assert analyzer.current_percolation_rank() == 1
+    analyzer.apply_diff(added=[[2, 3, 0, 1], [3, 2, 0, 0]])
+    assert analyzer.current_percolation_rank() == 2
+    assert analyzer.current_percolation_rank(0) == 1
+    analyzer.apply_diff(removed=[[0, 1, 0, 0]])
+    assert analyzer.current_percolation_rank(0) == 0
+    assert analyzer.current_percolation_rank() == 1
+    # the network itself is not modified
+    assert network.get_number_of_edges() == 2
+    with pytest.raises(ValueError):
+        analyzer.apply_diff(removed=[[0, 1, 0, 0]])
+    with pytest.raises(ValueError):
+        analyzer.apply_diff(added=[[0, 4, 0, 0]])
+    # an analyzer can be copied and sent to other processes
+    import copy
+    import pickle
+    analyzer.apply_diff(removed=[[2, 3, 0, 1]])
+    for copied in [pickle.loads(pickle.dumps(analyzer)), copy.deepcopy(analyzer)]:
+        assert copied.current_percolation_rank() == analyzer.current_percolation_rank()
+
+
+def test_trajectory_internal_clusters():
+    # a ring of four nodes that is closed by a single boundary-crossing edge
+    network = pn.PeriodicNetwork.from_edge_array([[0, 1, 0], [1, 2, 0], [2, 3, 0], [3, 0, 1]],
+                                                 n=6, dim=1)
+    analyzer = pn.TrajectoryAnalyzer(network)
+    assert analyzer.current_percolation_rank() == 1
+    # removing an internal edge splits a cluster
+    analyzer.apply_diff(removed=[[2, 1, 0]])
+    assert analyzer.current_percolation_rank() == 0
+    assert analyzer.current_percolation_rank(3) == 0
+    # an internal edge that does not split its cluster
+    analyzer.apply_diff(added=[[4, 5, 0], [5, 4, 0]])
+    analyzer.apply_diff(removed=[[4, 5, 0]])
+    assert analyzer.current_percolation_rank(4) == 0
+    # adding internal edges joins clusters
+    analyzer.apply_diff(added=[[1, 4, 0], [4, 2, 0]])
+    assert analyzer.current_percolation_rank() == 1
+    # node 5 is still attached to node 4 by the second edge between them
+    for node in range(6):
+        assert analyzer.current_percolation_rank(node) == 1
+
+
+def test_trajectory_long():
+    # enough frames to make the analyzer rebuild its edge index several times
+    bondlist = np.loadtxt("tests/testdata/bonds_0_00.dat", dtype=int)
+    n_nodes = bondlist[:, 0:2].max() + 1
+    network = pn.PeriodicNetwork.from_edge_array(bondlist, n=n_nodes, storage="csr")
+    analyzer = pn.TrajectoryAnalyzer(network)
+    rng = np.random.default_rng(2)
+    for _ in range(300):
+        flip = rng.choice(len(bondlist), size=2, replace=False)
+        analyzer.apply_diff(removed=bondlist[flip])
+        analyzer.apply_diff(added=bondlist[flip])
+    loops, n_loops = analyzer.get_independent_loops()
+    ref_loops, ref_n_loops = reference_loops(bondlist, n_nodes)
+    assert n_loops == ref_n_loops
+    assert np.all(loops == np.asarray(ref_loops).reshape(-1, 3))
+    assert not loops.flags.writeable